@@ -1,24 +1,45 @@
-from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Depends, Form, BackgroundTasks
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Depends, Form, BackgroundTasks, Request, Response
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from fastapi_mail import ConnectionConfig
 import os
 import logging
+import mimetypes
+import aiosmtplib
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List, Optional, NamedTuple
 import uuid
+import time
+from decimal import Decimal
+import re
+import math
+import random
+import hashlib
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone, timedelta
+from email.message import EmailMessage
+from email.utils import format_datetime, formataddr, parsedate_to_datetime
 import qrcode
 from io import BytesIO, StringIO
 import base64
 import json
 import shutil
 import csv
+import io
+import zipfile
 import pandas as pd
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter, A4
@@ -27,10 +48,11 @@ from reportlab.lib.utils import ImageReader
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from passlib.hash import bcrypt
+from PIL import Image as PILImage, ImageOps
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -43,6 +65,8 @@ db = client[os.environ['DB_NAME']]
 # Create directories if they don't exist
 uploads_dir = ROOT_DIR / "uploads"
 uploads_dir.mkdir(exist_ok=True)
+photo_variants_dir = uploads_dir / "variants"
+photo_variants_dir.mkdir(exist_ok=True)
 qr_codes_dir = ROOT_DIR / "qr_codes"
 qr_codes_dir.mkdir(exist_ok=True)
 billing_dir = ROOT_DIR / "billing"
@@ -53,6 +77,9 @@ shipping_dir = ROOT_DIR / "shipping"
 shipping_dir.mkdir(exist_ok=True)
 templates_dir = ROOT_DIR / "templates"
 templates_dir.mkdir(exist_ok=True)
+# Scratch space for in-progress writes; must share a filesystem with the dirs above
+tmp_dir = ROOT_DIR / "tmp"
+tmp_dir.mkdir(exist_ok=True)
 
 # Email Configuration
 email_conf = ConnectionConfig(
@@ -76,8 +103,15 @@ JWT_EXPIRE_HOURS = int(os.environ['JWT_EXPIRE_HOURS'])
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-# Jinja2 template environment
-env = Environment(loader=FileSystemLoader(str(templates_dir)))
+# Jinja2 template environment. Compiled templates stay in memory and in a
+# bytecode cache on disk; edits are only picked up with JINJA_AUTO_RELOAD.
+jinja_cache_dir = tmp_dir / "jinja"
+jinja_cache_dir.mkdir(exist_ok=True)
+env = Environment(
+    loader=FileSystemLoader(str(templates_dir)),
+    bytecode_cache=FileSystemBytecodeCache(str(jinja_cache_dir)),
+    auto_reload=os.environ.get('JINJA_AUTO_RELOAD', 'false').lower() in ('1', 'true', 'yes')
+)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -94,17 +128,211 @@ api_router = APIRouter(prefix="/api")
 
 # Global counter for PET IDs
 PET_COUNTER_COLLECTION = "pet_counter"
+PET_ID_BLOCK_SIZE = int(os.environ.get('PET_ID_BLOCK_SIZE', '100'))
+
+def format_pet_id(number: int) -> str:
+    return f"PET{number:06d}"
+
+class PetIdAllocator:
+    """Hands out PET IDs from blocks leased off the shared pet_counter.
+
+    Each worker reserves PET_ID_BLOCK_SIZE numbers with one $inc and serves
+    them from memory, so registrations no longer queue on the counter
+    document. Gap policy: numbers are unique but not gapless. IDs left in a
+    block when a worker stops are never issued, and across workers IDs are
+    not in registration order. A request for more IDs than remain leases a
+    block big enough to cover the rest. Set PET_ID_BLOCK_SIZE=1 for the
+    old strictly sequential behaviour.
+    """
+
+    def __init__(self, block_size: int):
+        self.block_size = max(block_size, 1)
+        self._next = 1
+        self._last = 0
+        self._lock = asyncio.Lock()
+
+    async def _lease(self, size: int):
+        counter_doc = await db[PET_COUNTER_COLLECTION].find_one_and_update(
+            {"_id": "pet_counter"},
+            {"$inc": {"count": size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._last = counter_doc["count"]
+        self._next = self._last - size + 1
+
+    async def allocate(self, count: int = 1) -> List[str]:
+        async with self._lock:
+            pet_ids = []
+            while len(pet_ids) < count:
+                if self._next > self._last:
+                    await self._lease(max(self.block_size, count - len(pet_ids)))
+                take = min(count - len(pet_ids), self._last - self._next + 1)
+                pet_ids.extend(format_pet_id(n) for n in range(self._next, self._next + take))
+                self._next += take
+            return pet_ids
+
+pet_id_allocator = PetIdAllocator(PET_ID_BLOCK_SIZE)
 
 async def get_next_pet_id():
     """Generate sequential PET ID like PET001234"""
-    counter_doc = await db[PET_COUNTER_COLLECTION].find_one_and_update(
-        {"_id": "pet_counter"},
-        {"$inc": {"count": 1}},
-        upsert=True,
-        return_document=True
+    pet_ids = await pet_id_allocator.allocate(1)
+    return pet_ids[0]
+
+def with_revision(update: dict) -> dict:
+    """Stamp a pets update document with a revision bump and updated_at"""
+    update = dict(update)
+    update["$set"] = {**update.get("$set", {}), "updated_at": datetime.now(timezone.utc)}
+    update["$inc"] = {**update.get("$inc", {}), "revision": 1}
+    return update
+
+# Materialized dashboard counters, kept in step with every status transition.
+# The stats_counters document mirrors compute_stats_snapshot(); drift from
+# races or out-of-band writes is repaired by reconcile_stats_counters().
+STATS_COUNTERS_ID = "pet_stats"
+
+def stats_value_key(value) -> str:
+    """Status values become field names, so keep them path-safe"""
+    if value is None:
+        return "none"
+    return str(value).replace(".", "_").replace("$", "_")
+
+def counter_key(field: str, value) -> str:
+    return f"{field}.{stats_value_key(value)}"
+
+async def increment_stats(increments: Dict[str, int]):
+    increments = {key: amount for key, amount in increments.items() if amount}
+    if increments:
+        await db.stats_counters.update_one(
+            {"_id": STATS_COUNTERS_ID},
+            {"$inc": increments},
+            upsert=True
+        )
+
+async def count_new_pets(pets: list):
+    """Add newly inserted pets to the stats counters"""
+    increments = {"total_pets": len(pets)}
+    for pet in pets:
+        for field in ("payment_status", "tag_status"):
+            key = counter_key(field, getattr(pet, field))
+            increments[key] = increments.get(key, 0) + 1
+    await increment_stats(increments)
+
+async def transition_pet(pet_id: str, field: str, new_value: str, extra_set: Optional[dict] = None) -> Optional[dict]:
+    """Set one pet's status field and move it between stats counters.
+
+    Returns the pet's previous status projection, or None when no pet
+    matched.
+    """
+    previous = await db.pets.find_one_and_update(
+        {"pet_id": pet_id},
+        with_revision({"$set": {field: new_value, **(extra_set or {})}}),
+        projection={"_id": 0, field: 1},
+        return_document=ReturnDocument.BEFORE
     )
-    count = counter_doc.get("count", 1) if counter_doc else 1
-    return f"PET{count:06d}"
+    if previous is not None and previous.get(field) != new_value:
+        await increment_stats({
+            counter_key(field, previous.get(field)): -1,
+            counter_key(field, new_value): 1
+        })
+    return previous
+
+async def transition_pets(pet_filter: dict, field: str, new_value: str, extra_set: Optional[dict] = None) -> int:
+    """Set a status field on many pets and move them between stats counters.
+
+    One update runs per distinct old value, so each modified_count says
+    exactly how many pets left that status. Returns the number of pets
+    whose status changed.
+    """
+    if extra_set:
+        await db.pets.update_many(
+            {**pet_filter, field: new_value},
+            with_revision({"$set": extra_set})
+        )
+    
+    increments = {}
+    moved = 0
+    old_values = await db.pets.distinct(field, {**pet_filter, field: {"$ne": new_value}})
+    for old_value in old_values:
+        result = await db.pets.update_many(
+            {**pet_filter, field: old_value},
+            with_revision({"$set": {field: new_value, **(extra_set or {})}})
+        )
+        if result.modified_count:
+            old_key = counter_key(field, old_value)
+            increments[old_key] = increments.get(old_key, 0) - result.modified_count
+            moved += result.modified_count
+    
+    increments[counter_key(field, new_value)] = moved
+    await increment_stats(increments)
+    return moved
+
+# CPU-bound rendering runs in a process pool so it never blocks the event loop.
+# Workers are spawned, so anything submitted must be a module-level function.
+RENDER_POOL_WORKERS = int(os.environ.get('RENDER_POOL_WORKERS', str(min(2, os.cpu_count() or 1))))
+render_pool: Optional[ProcessPoolExecutor] = None
+
+def render_qr_png(data: str, path: str):
+    """Render a QR code PNG, writing it into place atomically"""
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+    
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+    tmp_path = tmp_dir / f"{uuid.uuid4().hex}.png"
+    qr_img.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+
+async def run_in_render_pool(fn, *args):
+    """Run fn in the render pool, or a thread when the pool is disabled"""
+    if render_pool is None:
+        return await run_in_threadpool(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(render_pool, fn, *args)
+
+# Resized copies of uploaded photos, longest edge in pixels
+PHOTO_VARIANT_SIZES = {
+    "thumb": 160,
+    "scan": 640,
+    "print": 1200
+}
+PHOTO_VARIANT_QUALITY = int(os.environ.get('PHOTO_VARIANT_QUALITY', '80'))
+
+def render_photo_variants(source_path: str, pet_id: str) -> dict:
+    """Write recompressed JPEG variants of a photo and return their URLs by name"""
+    with PILImage.open(source_path) as original:
+        photo = ImageOps.exif_transpose(original).convert("RGB")
+    
+    variant_urls = {}
+    for name, size in PHOTO_VARIANT_SIZES.items():
+        variant = photo.copy()
+        variant.thumbnail((size, size), PILImage.LANCZOS)
+        variant_filename = f"{pet_id}_{name}.jpg"
+        tmp_path = tmp_dir / f"{uuid.uuid4().hex}.jpg"
+        variant.save(tmp_path, format="JPEG", quality=PHOTO_VARIANT_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp_path, photo_variants_dir / variant_filename)
+        variant_urls[name] = f"/uploads/variants/{variant_filename}"
+    return variant_urls
+
+async def generate_photo_variants(pet_id: str, photo_path: Path):
+    """Background task: build photo variants and record them on the pet"""
+    try:
+        variant_urls = await run_in_render_pool(render_photo_variants, str(photo_path), pet_id)
+    except Exception as e:
+        logging.warning(f"Could not build photo variants for {pet_id}: {str(e)}")
+        return
+    
+    await db.pets.update_one(
+        {"pet_id": pet_id},
+        with_revision({"$set": {"photo_variants": variant_urls}})
+    )
+    invalidate_scan_views(pet_id)
+
+async def generate_qr_code(pet_id: str) -> str:
+    """Render the scan QR code for a pet and return its public URL"""
+    qr_url = f"{os.environ.get('FRONTEND_BASE_URL', 'http://localhost:3000')}/scan/{pet_id}"
+    qr_filename = f"{pet_id}_qr.png"
+    await run_in_render_pool(render_qr_png, qr_url, str(qr_codes_dir / qr_filename))
+    return f"/qr_codes/{qr_filename}"
 
 # Pydantic Models
 class Owner(BaseModel):
@@ -123,6 +351,7 @@ class Pet(BaseModel):
     medical_info: Optional[str] = ""
     instructions: Optional[str] = ""
     photo_url: Optional[str] = None
+    photo_variants: Optional[Dict[str, str]] = None  # thumb, scan, print
     owner: Owner
     qr_code_url: Optional[str] = None
     tag_status: str = "ordered"  # ordered, printed, manufactured, shipped, delivered
@@ -137,6 +366,8 @@ class Pet(BaseModel):
     replacement_count: int = 0
     annual_adjustment_date: Optional[datetime] = None
     last_email_sent: Optional[datetime] = None
+    revision: int = 0  # bumped on every update, drives ETags
+    updated_at: Optional[datetime] = None
 
 class CustomerLogin(BaseModel):
     email: str
@@ -170,6 +401,11 @@ class FeeAdjustment(BaseModel):
     new_fee: float
     applied_date: datetime
     affected_pets: int
+    status: str = "running"  # running, completed, failed
+    total_pets: int = 0
+    last_pet_id: str = ""
+    completed_at: Optional[datetime] = None
+    error: Optional[str] = None
 
 class TagReplacement(BaseModel):
     original_pet_id: str
@@ -213,6 +449,48 @@ class PetRegistration(BaseModel):
     branch_code: str
     account_holder_name: str
 
+class OwnerSummary(BaseModel):
+    name: Optional[str] = None
+    mobile: Optional[str] = None
+    email: Optional[str] = None
+    address: Optional[str] = None
+    bank_account_number: Optional[str] = None
+    branch_code: Optional[str] = None
+    account_holder_name: Optional[str] = None
+
+class PetSummary(BaseModel):
+    """Projection of a Pet for admin tables; only requested fields are set"""
+    pet_id: str
+    name: Optional[str] = None
+    breed: Optional[str] = None
+    medical_info: Optional[str] = None
+    instructions: Optional[str] = None
+    photo_url: Optional[str] = None
+    photo_variants: Optional[Dict[str, str]] = None
+    owner: Optional[OwnerSummary] = None
+    qr_code_url: Optional[str] = None
+    tag_status: Optional[str] = None
+    payment_status: Optional[str] = None
+    monthly_fee: Optional[float] = None
+    created_at: Optional[datetime] = None
+    last_payment: Optional[datetime] = None
+    tag_fee_paid: Optional[bool] = None
+    manufacturing_batch: Optional[str] = None
+    shipping_tracking: Optional[str] = None
+    delivered_date: Optional[datetime] = None
+    replacement_count: Optional[int] = None
+    annual_adjustment_date: Optional[datetime] = None
+    last_email_sent: Optional[datetime] = None
+    revision: Optional[int] = None
+    updated_at: Optional[datetime] = None
+
+class BulkRegistrationRow(BaseModel):
+    row: int
+    success: bool
+    pet_id: Optional[str] = None
+    qr_code_url: Optional[str] = None
+    error: Optional[str] = None
+
 class QRScanResponse(BaseModel):
     pet_name: str
     pet_photo_url: Optional[str]
@@ -249,6 +527,284 @@ class AdminStats(BaseModel):
     total_revenue: float
     replacement_orders: int
 
+class CacheStats(BaseModel):
+    size: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+
+# In-process caches
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a fixed TTL.
+
+    Single-threaded by design: it is only touched from the event loop, so no
+    locking is needed. Counters are cumulative since process start.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def write_token(self) -> int:
+        """Token to pass to set() so a load that raced an invalidation is dropped"""
+        return self._generation
+
+    def set(self, key, value, token: Optional[int] = None):
+        if self.max_entries <= 0:
+            return
+        if token is not None and token != self._generation:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys):
+        self._generation += 1
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            size=len(self._entries),
+            max_entries=self.max_entries,
+            ttl_seconds=self.ttl_seconds,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations,
+            invalidations=self.invalidations
+        )
+
+# Public scan responses keyed by pet_id
+scan_cache = TTLCache(
+    max_entries=int(os.environ.get('SCAN_CACHE_MAX_ENTRIES', '10000')),
+    ttl_seconds=float(os.environ.get('SCAN_CACHE_TTL_SECONDS', '300'))
+)
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key onto one in-flight task.
+
+    Callers await a shielded task, so a cancelled request does not cancel
+    the lookup other callers are waiting on.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter went away
+            task.exception()
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def forget(self, *keys):
+        """Make later callers start a fresh call instead of joining one in flight"""
+        for key in keys:
+            self._calls.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "calls": self.calls, "shared": self.shared}
+
+scan_flight = SingleFlight()
+profile_flight = SingleFlight()
+
+def invalidate_scan_views(*pet_ids):
+    """Drop cached and in-flight scan reads for pets that were just written"""
+    scan_cache.invalidate(*pet_ids)
+    scan_flight.forget(*pet_ids)
+
+async def invalidate_owner_scan_cache(owner_email: str):
+    """Drop cached scan responses for every pet belonging to an owner"""
+    pet_ids = await db.pets.distinct("pet_id", {"owner.email": owner_email})
+    invalidate_scan_views(*pet_ids)
+    profile_flight.forget(owner_email)
+
+# Pet IDs recently confirmed missing, so repeated bad scans skip MongoDB
+scan_negative_cache = TTLCache(
+    max_entries=int(os.environ.get('SCAN_NEGATIVE_CACHE_MAX_ENTRIES', '50000')),
+    ttl_seconds=float(os.environ.get('SCAN_NEGATIVE_CACHE_TTL_SECONDS', '30'))
+)
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over one blake2b digest"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / self.capacity * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+PET_ID_PATTERN = re.compile(r"^PET(\d+)$")
+
+# ObjectIds are minted client-side, so a pet inserted just before a sync can
+# carry a lower _id than one the sync already saw. Incremental refreshes
+# re-scan this far back, and a periodic full rebuild covers clock skew.
+PET_ID_FILTER_REFRESH_SECONDS = float(os.environ.get('PET_ID_FILTER_REFRESH_SECONDS', '30'))
+PET_ID_FILTER_OVERLAP_SECONDS = float(os.environ.get('PET_ID_FILTER_OVERLAP_SECONDS', '300'))
+PET_ID_FILTER_REBUILD_SECONDS = float(os.environ.get('PET_ID_FILTER_REBUILD_SECONDS', '3600'))
+# IDs this close below the PET counter may sit in a block another worker
+# leased but hasn't issued from yet, so misses there still go to MongoDB
+PET_ID_FILTER_GRACE_IDS = int(os.environ.get('PET_ID_FILTER_GRACE_IDS', str(PET_ID_BLOCK_SIZE * 4)))
+
+class PetIdFilter:
+    """Bloom filter of every registered pet_id, used to reject unknown scans.
+
+    The filter is rebuilt from pets.pet_id at startup and every
+    PET_ID_FILTER_REBUILD_SECONDS, and topped up in between by re-scanning
+    pets whose _id falls within PET_ID_FILTER_OVERLAP_SECONDS of the last
+    sync, so pets registered by other workers appear within
+    PET_ID_FILTER_REFRESH_SECONDS. IDs numbered above the PET counter seen
+    at the last sync, less PET_ID_FILTER_GRACE_IDS, are always passed
+    through to MongoDB, since they may have been issued after it. Until the
+    first rebuild completes every ID passes.
+    """
+
+    def __init__(self, error_rate: float = 0.001):
+        self.error_rate = error_rate
+        self.ready = False
+        self.high_water = 0
+        self.rejections = 0
+        self._bloom = BloomFilter(1, error_rate)
+        self._synced_at = None
+        self._rebuilt_at = 0.0
+
+    def might_exist(self, pet_id: str) -> bool:
+        if not self.ready:
+            return True
+        match = PET_ID_PATTERN.match(pet_id)
+        if not match:
+            return False
+        if pet_id in self._bloom:
+            return True
+        return int(match.group(1)) > self.high_water - PET_ID_FILTER_GRACE_IDS
+
+    def add(self, pet_id: str):
+        if pet_id not in self._bloom:
+            self._bloom.add(pet_id)
+        match = PET_ID_PATTERN.match(pet_id)
+        if match:
+            self.high_water = max(self.high_water, int(match.group(1)))
+        if self._bloom.count > self._bloom.capacity:
+            # Past capacity the false-positive rate climbs; resize on next sync
+            self._synced_at = None
+
+    async def _read_counter(self) -> int:
+        counter_doc = await db[PET_COUNTER_COLLECTION].find_one({"_id": "pet_counter"})
+        return counter_doc.get("count", 0) if counter_doc else 0
+
+    async def rebuild(self):
+        synced_at = datetime.now(timezone.utc)
+        high_water = await self._read_counter()
+        total = await db.pets.estimated_document_count()
+        bloom = BloomFilter(max(total * 2, 10000), self.error_rate)
+        async for doc in db.pets.find({}, {"pet_id": 1}):
+            bloom.add(doc["pet_id"])
+        self._bloom = bloom
+        self._synced_at = synced_at
+        self._rebuilt_at = time.monotonic()
+        self.high_water = max(self.high_water, high_water)
+        self.ready = True
+        logging.info(f"Pet ID filter rebuilt with {bloom.count} IDs")
+
+    async def refresh(self):
+        if (not self.ready or self._synced_at is None
+                or time.monotonic() - self._rebuilt_at >= PET_ID_FILTER_REBUILD_SECONDS):
+            await self.rebuild()
+            return
+        synced_at = datetime.now(timezone.utc)
+        high_water = await self._read_counter()
+        since = ObjectId.from_datetime(self._synced_at - timedelta(seconds=PET_ID_FILTER_OVERLAP_SECONDS))
+        async for doc in db.pets.find({"_id": {"$gte": since}}, {"pet_id": 1}):
+            if doc["pet_id"] not in self._bloom:
+                self._bloom.add(doc["pet_id"])
+        self._synced_at = synced_at
+        self.high_water = max(self.high_water, high_water)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ids": self._bloom.count,
+            "capacity": self._bloom.capacity,
+            "bits": self._bloom.num_bits,
+            "hashes": self._bloom.num_hashes,
+            "high_water": self.high_water,
+            "rejections": self.rejections
+        }
+
+pet_id_filter = PetIdFilter()
+
+async def refresh_pet_id_filter_periodically():
+    while True:
+        try:
+            await pet_id_filter.refresh()
+        except Exception as e:
+            logging.error(f"Error refreshing pet ID filter: {str(e)}")
+        await asyncio.sleep(PET_ID_FILTER_REFRESH_SECONDS)
+
+def register_known_pet_id(pet_id: str):
+    """Make a newly inserted pet_id scannable immediately on this worker"""
+    pet_id_filter.add(pet_id)
+    scan_negative_cache.invalidate(pet_id)
+
 # Authentication functions
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -270,30 +826,426 @@ def verify_token(token: str):
 async def get_current_customer(credentials: HTTPAuthorizationCredentials = Depends(security)):
     return verify_token(credentials.credentials)
 
-# Email functions
-async def send_email(to: str, subject: str, template_name: str, context: dict, attachments: List = None):
-    """Send email with template"""
-    try:
-        template = env.get_template(template_name)
-        html_body = template.render(**context)
-        
-        message = MessageSchema(
-            subject=subject,
-            recipients=[to],
-            body=html_body,
-            subtype="html",
-            attachments=attachments or []
-        )
-        
-        fm = FastMail(email_conf)
-        await fm.send_message(message)
+# Email outbox
+# The send_* helpers only enqueue into email_outbox; drain_email_outbox()
+# renders and delivers queued mail over a small pool of long-lived SMTP
+# sessions, so queued mail survives a restart and messages share the
+# STARTTLS handshake and login instead of paying for one each.
+EMAIL_POOL_SIZE = int(os.environ.get('EMAIL_POOL_SIZE', '2'))
+EMAIL_MESSAGES_PER_SESSION = int(os.environ.get('EMAIL_MESSAGES_PER_SESSION', '100'))
+EMAIL_SESSION_IDLE_SECONDS = float(os.environ.get('EMAIL_SESSION_IDLE_SECONDS', '60'))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+EMAIL_SEND_LEASE_SECONDS = int(os.environ.get('EMAIL_SEND_LEASE_SECONDS', '300'))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS', '30'))
+# Gmail rejects bursts, so dispatch is held under a per-minute token bucket
+# and a per-day cap counted in email_quota (one document per UTC day).
+EMAIL_RATE_PER_MINUTE = float(os.environ.get('EMAIL_RATE_PER_MINUTE', '30'))
+EMAIL_BURST = int(os.environ.get('EMAIL_BURST', '10'))
+EMAIL_DAILY_CAP = int(os.environ.get('EMAIL_DAILY_CAP', '2000'))
+# Transient failures retry with full-jitter exponential backoff
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', '6'))
+EMAIL_RETRY_BASE_SECONDS = float(os.environ.get('EMAIL_RETRY_BASE_SECONDS', '30'))
+EMAIL_RETRY_MAX_SECONDS = float(os.environ.get('EMAIL_RETRY_MAX_SECONDS', '3600'))
+# Sent messages expire from email_outbox (TTL on sent_at); failed ones stay for inspection
+EMAIL_OUTBOX_RETENTION_SECONDS = int(os.environ.get('EMAIL_OUTBOX_RETENTION_SECONDS', str(30 * 24 * 3600)))
+
+outbox_wakeup = asyncio.Event()
+
+class TokenBucket:
+    """Hands out up to rate tokens per period, with bursts of up to capacity.
+
+    acquire() waits for a token; waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, period: float, capacity: int):
+        self.rate = rate
+        self.period = period
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.waited_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate / self.period)
+        self.updated = now
+
+    def available_within(self, seconds: float) -> int:
+        """Tokens that can be handed out over the next seconds"""
+        self._refill()
+        return int(self.tokens + seconds * self.rate / self.period)
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                wait = (1 - self.tokens) * self.period / self.rate
+                self.waited_seconds += wait
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+
+email_rate_limit = TokenBucket(EMAIL_RATE_PER_MINUTE, 60, EMAIL_BURST)
+
+class EmailMetrics:
+    def __init__(self):
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "throttled_seconds": round(email_rate_limit.waited_seconds, 3)
+        }
+
+email_metrics = EmailMetrics()
+
+def email_quota_day() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+async def email_quota_remaining() -> int:
+    quota = await db.email_quota.find_one({"_id": email_quota_day()})
+    return max(0, EMAIL_DAILY_CAP - (quota or {}).get("used", 0))
+
+def is_transient_email_error(error: Exception) -> bool:
+    """Whether a send failure is worth retrying later"""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(is_transient_email_error(refusal) for refusal in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPAuthenticationError):
+        # Credentials get fixed; the mail shouldn't be lost meanwhile
         return True
-    except Exception as e:
-        logging.error(f"Failed to send email: {str(e)}")
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        # Gmail reports its rate and quota limits as 550/421 5.4.5
+        return 400 <= error.code < 500 or "5.4.5" in error.message
+    return isinstance(error, (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError))
+
+def reached_email_server(error: Optional[Exception]) -> bool:
+    """Whether a send outcome handed the message to the server (and so counts against the quota)"""
+    if error is None or isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, (aiosmtplib.SMTPAuthenticationError, aiosmtplib.SMTPConnectResponseError)):
+        # Rejected before any message was offered
         return False
+    return isinstance(error, aiosmtplib.SMTPResponseException)
+
+def email_retry_delay(attempts: int) -> float:
+    return random.uniform(0, min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1)))
+
+class SMTPSession:
+    def __init__(self, smtp: aiosmtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+class SMTPPool:
+    """A fixed number of authenticated SMTP sessions shared by concurrent senders.
+
+    Sessions open lazily, carry up to messages_per_session messages and
+    are dropped after any error or idle_timeout seconds unused (servers
+    close idle connections), so the next send on that slot reconnects. A
+    reused session the server turns out to have dropped is replaced once
+    before the send is reported as failed.
+    """
+
+    def __init__(self, hostname: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 start_tls: bool = False, use_tls: bool = False, validate_certs: bool = True,
+                 size: int = 2, messages_per_session: int = 100, idle_timeout: float = 60):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.use_tls = use_tls
+        self.validate_certs = validate_certs
+        self.messages_per_session = messages_per_session
+        self.idle_timeout = idle_timeout
+        self._slots = asyncio.Queue()
+        for _ in range(size):
+            self._slots.put_nowait(None)
+        self.sessions_opened = 0
+        self.messages_sent = 0
+
+    @classmethod
+    def from_config(cls, conf: ConnectionConfig, **kwargs) -> "SMTPPool":
+        return cls(
+            conf.MAIL_SERVER,
+            conf.MAIL_PORT,
+            username=conf.MAIL_USERNAME if conf.USE_CREDENTIALS else None,
+            password=conf.MAIL_PASSWORD.get_secret_value() if conf.USE_CREDENTIALS else None,
+            start_tls=conf.MAIL_STARTTLS,
+            use_tls=conf.MAIL_SSL_TLS,
+            validate_certs=conf.VALIDATE_CERTS,
+            **kwargs
+        )
 
-async def send_qr_code_email(pet: Pet, background_tasks: BackgroundTasks):
-    """Send QR code email after registration"""
+    async def _connect(self) -> SMTPSession:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.use_tls,
+            start_tls=False,
+            validate_certs=self.validate_certs
+        )
+        await smtp.connect()
+        if self.start_tls:
+            await smtp.starttls()
+        if self.username:
+            await smtp.login(self.username, self.password)
+        self.sessions_opened += 1
+        return SMTPSession(smtp)
+
+    @staticmethod
+    async def _close(session: SMTPSession):
+        try:
+            await session.smtp.quit()
+        except Exception:
+            session.smtp.close()
+
+    def _reusable(self, session: SMTPSession) -> bool:
+        return (
+            session.sent < self.messages_per_session
+            and time.monotonic() - session.last_used < self.idle_timeout
+            and session.smtp.is_connected
+        )
+
+    async def send(self, message: EmailMessage):
+        session = await self._slots.get()
+        try:
+            if session is not None and not self._reusable(session):
+                await self._close(session)
+                session = None
+            reused = session is not None
+            if session is None:
+                session = await self._connect()
+            try:
+                await session.smtp.send_message(message)
+            except aiosmtplib.SMTPServerDisconnected:
+                if not reused:
+                    raise
+                await self._close(session)
+                session = None
+                session = await self._connect()
+                await session.smtp.send_message(message)
+            session.sent += 1
+            session.last_used = time.monotonic()
+            self.messages_sent += 1
+        except BaseException:
+            if session is not None:
+                await self._close(session)
+            session = None
+            raise
+        finally:
+            self._slots.put_nowait(session)
+
+    async def close(self):
+        while not self._slots.empty():
+            session = self._slots.get_nowait()
+            if session is not None:
+                await self._close(session)
+
+smtp_pool = SMTPPool.from_config(
+    email_conf,
+    size=EMAIL_POOL_SIZE,
+    messages_per_session=EMAIL_MESSAGES_PER_SESSION,
+    idle_timeout=EMAIL_SESSION_IDLE_SECONDS
+)
+
+def outbox_email(to: str, subject: str, template_name: str, context: dict, attachments: List[dict] = None) -> dict:
+    """Build an email_outbox document; attachments are {"path", "cid"} inline images"""
+    now = datetime.now(timezone.utc)
+    return {
+        "_id": uuid.uuid4().hex,
+        "to": to,
+        "subject": subject,
+        "template": template_name,
+        "context": context,
+        "attachments": attachments or [],
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": now
+    }
+
+async def enqueue_emails(emails: List[dict]):
+    if not emails:
+        return
+    await db.email_outbox.insert_many(emails)
+    email_metrics.queued += len(emails)
+    outbox_wakeup.set()
+
+EMAIL_TEMPLATES = [
+    "qr_code_email.html",
+    "payment_reminder.html",
+    "payment_reminder_digest.html",
+    "shipping_notification.html",
+    "shipping_notification_digest.html"
+]
+
+def precompile_email_templates():
+    """Compile every notification template, filling the bytecode cache"""
+    for template_name in EMAIL_TEMPLATES:
+        env.get_template(template_name)
+
+def render_email_batch(template_name: str, contexts: List[dict], return_exceptions: bool = False) -> list:
+    """Render one template for many contexts (blocking: run off the event loop).
+
+    With return_exceptions a context that fails to render yields its
+    exception in place of the HTML instead of failing the whole batch.
+    """
+    template = env.get_template(template_name)
+    rendered = []
+    for context in contexts:
+        try:
+            rendered.append(template.render(**context))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            rendered.append(e)
+    return rendered
+
+def build_email_message(outbox_doc: dict, html_body: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = formataddr((email_conf.MAIL_FROM_NAME or "", email_conf.MAIL_FROM))
+    message["To"] = outbox_doc["to"]
+    message["Subject"] = outbox_doc["subject"]
+    message.set_content(html_body, subtype="html")
+    
+    for attachment in outbox_doc.get("attachments", []):
+        path = Path(attachment["path"])
+        if not path.exists():
+            continue
+        maintype, subtype = (mimetypes.guess_type(path.name)[0] or "application/octet-stream").split("/", 1)
+        message.add_related(path.read_bytes(), maintype=maintype, subtype=subtype, cid=f"<{attachment['cid']}>", filename=path.name)
+    return message
+
+def compose_emails(outbox_docs: List[dict]) -> list:
+    """Render queued emails into MIME messages, one render batch per template.
+
+    Blocking (templates and attachments come off disk). Returns a message
+    or the exception that prevented one, in outbox_docs order.
+    """
+    by_template = {}
+    for position, outbox_doc in enumerate(outbox_docs):
+        by_template.setdefault(outbox_doc["template"], []).append(position)
+    
+    messages = [None] * len(outbox_docs)
+    for template_name, positions in by_template.items():
+        try:
+            bodies = render_email_batch(template_name, [outbox_docs[i]["context"] for i in positions], return_exceptions=True)
+        except Exception as e:
+            bodies = [e] * len(positions)
+        for position, body in zip(positions, bodies):
+            if isinstance(body, Exception):
+                messages[position] = body
+                continue
+            try:
+                messages[position] = build_email_message(outbox_docs[position], body)
+            except Exception as e:
+                messages[position] = e
+    return messages
+
+async def claim_outbox_batch(limit: int) -> List[dict]:
+    """Lease up to limit due messages to this worker.
+
+    A message whose sender died mid-send comes due again once its lease
+    lapses, so delivery is at-least-once.
+    """
+    now = datetime.now(timezone.utc)
+    due = {"status": {"$in": ["pending", "sending"]}, "next_attempt_at": {"$lte": now}}
+    candidates = await db.email_outbox.find(due, {"_id": 1}).sort("next_attempt_at", ASCENDING).limit(limit).to_list(limit)
+    if not candidates:
+        return []
+    
+    ids = [doc["_id"] for doc in candidates]
+    lease_token = uuid.uuid4().hex
+    await db.email_outbox.update_many(
+        {**due, "_id": {"$in": ids}},
+        {
+            "$set": {
+                "status": "sending",
+                "lease_token": lease_token,
+                "next_attempt_at": now + timedelta(seconds=EMAIL_SEND_LEASE_SECONDS)
+            },
+            "$inc": {"attempts": 1}
+        }
+    )
+    return await db.email_outbox.find({"_id": {"$in": ids}, "lease_token": lease_token}).to_list(len(ids))
+
+async def deliver_outbox_batch(outbox_docs: List[dict]):
+    outcomes = []
+    
+    async def deliver(outbox_doc, message):
+        try:
+            if isinstance(message, Exception):
+                raise message
+            await email_rate_limit.acquire()
+            await smtp_pool.send(message)
+            outcomes.append((outbox_doc, None))
+        except Exception as e:
+            outcomes.append((outbox_doc, e))
+    
+    messages = await run_in_threadpool(compose_emails, outbox_docs)
+    await asyncio.gather(*(deliver(outbox_doc, message) for outbox_doc, message in zip(outbox_docs, messages)))
+    
+    now = datetime.now(timezone.utc)
+    operations = []
+    for outbox_doc, error in outcomes:
+        if error is None:
+            update = {"$set": {"status": "sent", "sent_at": now}}
+            email_metrics.sent += 1
+        elif is_transient_email_error(error) and outbox_doc["attempts"] < EMAIL_MAX_ATTEMPTS:
+            delay = email_retry_delay(outbox_doc["attempts"])
+            logging.warning(f"Retrying email {outbox_doc['_id']} to {outbox_doc['to']} in {delay:.0f}s: {str(error)}")
+            update = {"$set": {"status": "pending", "error": str(error), "next_attempt_at": now + timedelta(seconds=delay)}}
+            email_metrics.retried += 1
+        else:
+            logging.error(f"Failed to send email {outbox_doc['_id']} to {outbox_doc['to']}: {str(error)}")
+            update = {"$set": {"status": "failed", "error": str(error)}}
+            email_metrics.failed += 1
+        update["$unset"] = {"lease_token": ""}
+        operations.append(UpdateOne({"_id": outbox_doc["_id"], "lease_token": outbox_doc["lease_token"]}, update))
+    if operations:
+        await db.email_outbox.bulk_write(operations, ordered=False)
+    # Compose and connection failures never reached the server, so they don't use quota
+    attempted = sum(1 for _, error in outcomes if reached_email_server(error))
+    if attempted:
+        await db.email_quota.update_one(
+            {"_id": email_quota_day()},
+            {"$inc": {"used": attempted}},
+            upsert=True
+        )
+
+async def drain_email_outbox():
+    """Deliver queued mail until cancelled, idling until woken or the poll interval"""
+    while True:
+        outbox_wakeup.clear()
+        try:
+            # Only claim what the rate limit lets out well inside the lease,
+            # so no claimed message is still waiting when it can be reclaimed
+            limit = min(
+                EMAIL_OUTBOX_BATCH_SIZE,
+                await email_quota_remaining(),
+                email_rate_limit.available_within(EMAIL_SEND_LEASE_SECONDS / 2)
+            )
+            outbox_docs = await claim_outbox_batch(limit) if limit else []
+            if outbox_docs:
+                await deliver_outbox_batch(outbox_docs)
+                continue
+        except Exception as e:
+            logging.error(f"Error draining email outbox: {str(e)}")
+        try:
+            await asyncio.wait_for(outbox_wakeup.wait(), EMAIL_OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+def qr_code_email(pet: Pet) -> dict:
+    """Build the registration confirmation outbox email for a pet"""
     qr_path = qr_codes_dir / f"{pet.pet_id}_qr.png"
     
     context = {
@@ -308,13 +1260,9 @@ async def send_qr_code_email(pet: Pet, background_tasks: BackgroundTasks):
     
     attachments = []
     if qr_path.exists():
-        attachments.append({
-            "file": str(qr_path),
-            "headers": {"Content-ID": "<qr_image>"}
-        })
+        attachments.append({"path": str(qr_path), "cid": "qr_image"})
     
-    background_tasks.add_task(
-        send_email,
+    return outbox_email(
         pet.owner.email,
         f"🐾 {pet.name}'s Pet Tag Registration Confirmed - {pet.pet_id}",
         "qr_code_email.html",
@@ -322,44 +1270,99 @@ async def send_qr_code_email(pet: Pet, background_tasks: BackgroundTasks):
         attachments
     )
 
-async def send_payment_reminder(pet: Pet, background_tasks: BackgroundTasks):
-    """Send payment reminder email"""
-    context = {
-        "owner_name": pet.owner.name,
-        "pet_name": pet.name,
-        "pet_id": pet.pet_id,
-        "monthly_fee": f"{pet.monthly_fee:.2f}",
-        "amount_due": f"{pet.monthly_fee:.2f}",
-        "last_payment_date": pet.last_payment.strftime("%Y-%m-%d") if pet.last_payment else "Never"
-    }
+async def send_qr_code_email(pet: Pet):
+    """Send QR code email after registration"""
+    await enqueue_emails([qr_code_email(pet)])
+
+# Owner digests: one email per owner per run covering all of their pets.
+# Owners with a single pet still get the single-pet template.
+EMAIL_ENQUEUE_BATCH_SIZE = 500
+
+def owner_digest_pipeline(match: dict, pet_fields: dict) -> list:
+    return [
+        {"$match": match},
+        {"$sort": {"pet_id": 1}},
+        {"$group": {
+            "_id": "$owner.email",
+            "owner_name": {"$first": "$owner.name"},
+            "pets": {"$push": {"pet_id": "$pet_id", "pet_name": "$name", **pet_fields}}
+        }}
+    ]
+
+async def send_payment_reminders_to_owners(match: dict) -> tuple:
+    """Queue one payment reminder per owner for the pets matching match.
+
+    Returns (emails_queued, pet_ids_reminded).
+    """
+    emails = []
+    queued = 0
+    pet_ids = []
+    cursor = db.pets.aggregate(owner_digest_pipeline(match, {
+        "monthly_fee": {"$ifNull": ["$monthly_fee", 2.0]},
+        "last_payment": "$last_payment"
+    }), allowDiskUse=True)
+    async for owner in cursor:
+        pets = [{
+            "pet_name": pet["pet_name"],
+            "pet_id": pet["pet_id"],
+            "monthly_fee": f"{pet['monthly_fee']:.2f}",
+            "last_payment_date": pet["last_payment"].strftime("%Y-%m-%d") if pet.get("last_payment") else "Never"
+        } for pet in owner["pets"]]
+        amount_due = f"{sum(pet['monthly_fee'] for pet in owner['pets']):.2f}"
+        
+        if len(pets) == 1:
+            emails.append(outbox_email(
+                owner["_id"],
+                f"💳 Payment Reminder for {pets[0]['pet_name']} - {pets[0]['pet_id']}",
+                "payment_reminder.html",
+                {"owner_name": owner["owner_name"], **pets[0], "amount_due": amount_due}
+            ))
+        else:
+            emails.append(outbox_email(
+                owner["_id"],
+                f"💳 Payment Reminder for {len(pets)} pets",
+                "payment_reminder_digest.html",
+                {"owner_name": owner["owner_name"], "pets": pets, "amount_due": amount_due}
+            ))
+        pet_ids.extend(pet["pet_id"] for pet in pets)
+        
+        if len(emails) >= EMAIL_ENQUEUE_BATCH_SIZE:
+            await enqueue_emails(emails)
+            queued += len(emails)
+            emails = []
     
-    background_tasks.add_task(
-        send_email,
-        pet.owner.email,
-        f"💳 Payment Reminder for {pet.name} - {pet.pet_id}",
-        "payment_reminder.html",
-        context
-    )
+    await enqueue_emails(emails)
+    return queued + len(emails), pet_ids
 
-async def send_shipping_notification(pet: Pet, courier: str, tracking_number: str, background_tasks: BackgroundTasks):
-    """Send shipping notification"""
-    context = {
-        "owner_name": pet.owner.name,
-        "pet_name": pet.name,
-        "pet_id": pet.pet_id,
+async def send_shipping_notifications(pet_ids: List[str], courier: str, tracking_number: str) -> int:
+    """Queue one shipping notification per owner; returns the emails queued"""
+    shipment = {
         "courier": courier,
         "tracking_number": tracking_number,
         "shipping_date": datetime.now().strftime("%Y-%m-%d"),
         "estimated_delivery": (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d")
     }
     
-    background_tasks.add_task(
-        send_email,
-        pet.owner.email,
-        f"📦 {pet.name}'s Pet Tag Shipped - {pet.pet_id}",
-        "shipping_notification.html",
-        context
-    )
+    emails = []
+    async for owner in db.pets.aggregate(owner_digest_pipeline({"pet_id": {"$in": pet_ids}}, {})):
+        pets = owner["pets"]
+        if len(pets) == 1:
+            emails.append(outbox_email(
+                owner["_id"],
+                f"📦 {pets[0]['pet_name']}'s Pet Tag Shipped - {pets[0]['pet_id']}",
+                "shipping_notification.html",
+                {"owner_name": owner["owner_name"], **pets[0], **shipment}
+            ))
+        else:
+            emails.append(outbox_email(
+                owner["_id"],
+                f"📦 {len(pets)} Pet Tags Shipped",
+                "shipping_notification_digest.html",
+                {"owner_name": owner["owner_name"], "pets": pets, **shipment}
+            ))
+    
+    await enqueue_emails(emails)
+    return len(emails)
 
 # Admin authentication (simple for MVP)
 ADMIN_TOKEN = "admin123"
@@ -369,10 +1372,129 @@ def verify_admin(token: str = None):
         raise HTTPException(status_code=401, detail="Unauthorized")
     return True
 
+# Photo uploads
+MAX_PHOTO_UPLOAD_BYTES = int(os.environ.get('MAX_PHOTO_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.environ.get('UPLOAD_CHUNK_BYTES', str(256 * 1024)))
+# Allowance for the pet_data field and multipart framing around the photo
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_SIZE_LIMITS = {
+    "/api/pets/register": MAX_PHOTO_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+}
+
+class UploadSizeLimitMiddleware:
+    """Refuse oversize upload bodies before the app reads them into a form.
+
+    Content-Length is checked up front; bodies without one (chunked) are
+    counted as they stream in. Plain ASGI rather than @app.middleware("http"),
+    so requests to other paths (scans especially) pass straight through.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > limit:
+                    await self.reject(scope, receive, send)
+                    return
+                break
+        
+        received = 0
+        response_started = False
+        rejected = False
+        
+        async def limited_receive():
+            nonlocal received, rejected
+            if received > limit:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    if not response_started:
+                        rejected = True
+                        await self.reject(scope, receive, send)
+                    # Look like a dropped client so the app stops reading the body
+                    return {"type": "http.disconnect"}
+            return message
+        
+        async def tracked_send(message):
+            nonlocal response_started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        await self.app(scope, limited_receive, tracked_send)
+
+    @staticmethod
+    async def reject(scope, receive, send):
+        response = JSONResponse(status_code=413, content={"detail": "Upload too large"})
+        await response(scope, receive, send)
+
+app.add_middleware(UploadSizeLimitMiddleware, limits=UPLOAD_SIZE_LIMITS)
+
+async def stream_upload_to_temp(upload: UploadFile, max_bytes: int) -> Path:
+    """Copy an upload to tmp_dir in chunks off the event loop, enforcing max_bytes.
+
+    The caller renames the returned file into place, so partially written
+    files never appear under a served directory.
+    """
+    tmp_path = tmp_dir / f"{uuid.uuid4().hex}.part"
+    buffer = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        written = 0
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes} bytes")
+            await run_in_threadpool(buffer.write, chunk)
+        await run_in_threadpool(buffer.close)
+        return tmp_path
+    except BaseException:
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(tmp_path.unlink, True)
+        raise
+
 @api_router.get("/")
 async def root():
     return {"message": "Pet Tag System API with Customer Portal"}
 
+def build_registered_pet(pet_id: str, registration_data: PetRegistration, photo_url: Optional[str], qr_code_url: str) -> Pet:
+    owner_data = Owner(
+        name=registration_data.owner_name,
+        mobile=registration_data.mobile,
+        email=registration_data.email,
+        address=registration_data.address,
+        bank_account_number=registration_data.bank_account_number,
+        branch_code=registration_data.branch_code,
+        account_holder_name=registration_data.account_holder_name
+    )
+    
+    return Pet(
+        pet_id=pet_id,
+        name=registration_data.pet_name,
+        breed=registration_data.breed,
+        medical_info=registration_data.medical_info,
+        instructions=registration_data.instructions,
+        photo_url=photo_url,
+        owner=owner_data,
+        qr_code_url=qr_code_url,
+        last_payment=datetime.now(timezone.utc),
+        annual_adjustment_date=datetime.now(timezone.utc)
+    )
+
 @api_router.post("/pets/register")
 async def register_pet(
     pet_data: str = Form(...),
@@ -384,81 +1506,146 @@ async def register_pet(
         pet_info = json.loads(pet_data)
         registration_data = PetRegistration(**pet_info)
         
-        pet_id = await get_next_pet_id()
-        
-        # Save uploaded photo
-        photo_filename = f"{pet_id}_{photo.filename}"
-        photo_path = uploads_dir / photo_filename
-        
-        with open(photo_path, "wb") as buffer:
-            shutil.copyfileobj(photo.file, buffer)
+        # Stream the photo to a temp file first so oversize uploads never use a PET ID
+        tmp_photo_path = await stream_upload_to_temp(photo, MAX_PHOTO_UPLOAD_BYTES)
+        try:
+            pet_id = await get_next_pet_id()
+            
+            photo_filename = f"{pet_id}_{Path(photo.filename or 'photo').name}"
+            await run_in_threadpool(os.replace, tmp_photo_path, uploads_dir / photo_filename)
+        except BaseException:
+            await run_in_threadpool(tmp_photo_path.unlink, True)
+            raise
         
         photo_url = f"/uploads/{photo_filename}"
         
         # Generate QR code
-        qr_url = f"{os.environ.get('FRONTEND_BASE_URL', 'http://localhost:3000')}/scan/{pet_id}"
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_url)
-        qr.make(fit=True)
-        
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_filename = f"{pet_id}_qr.png"
-        qr_path = qr_codes_dir / qr_filename
-        qr_img.save(qr_path)
-        qr_code_url = f"/qr_codes/{qr_filename}"
+        qr_code_url = await generate_qr_code(pet_id)
         
         # Create pet document
-        owner_data = Owner(
-            name=registration_data.owner_name,
-            mobile=registration_data.mobile,
-            email=registration_data.email,
-            address=registration_data.address,
-            bank_account_number=registration_data.bank_account_number,
-            branch_code=registration_data.branch_code,
-            account_holder_name=registration_data.account_holder_name
-        )
-        
-        pet = Pet(
-            pet_id=pet_id,
-            name=registration_data.pet_name,
-            breed=registration_data.breed,
-            medical_info=registration_data.medical_info,
-            instructions=registration_data.instructions,
-            photo_url=photo_url,
-            owner=owner_data,
-            qr_code_url=qr_code_url,
-            last_payment=datetime.now(timezone.utc),
-            annual_adjustment_date=datetime.now(timezone.utc)
-        )
+        pet = build_registered_pet(pet_id, registration_data, photo_url, qr_code_url)
         
         await db.pets.insert_one(pet.dict())
+        await count_new_pets([pet])
+        register_known_pet_id(pet_id)
+        background_tasks.add_task(generate_photo_variants, pet_id, uploads_dir / photo_filename)
         
         # Send email notification
-        await send_qr_code_email(pet, background_tasks)
+        await send_qr_code_email(pet)
         
         return {"success": True, "pet_id": pet_id, "qr_code_url": qr_code_url}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error registering pet: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Only the fields a finder sees; keeps bank details off the wire
+SCAN_PROJECTION = {
+    "_id": 0,
+    "name": 1,
+    "photo_url": 1,
+    "photo_variants.scan": 1,
+    "owner.name": 1,
+    "owner.mobile": 1,
+    "revision": 1,
+    "updated_at": 1,
+    "created_at": 1
+}
+
+SCAN_CACHE_CONTROL = os.environ.get('SCAN_CACHE_CONTROL', 'public, max-age=30, stale-while-revalidate=60')
+QR_DOWNLOAD_CACHE_CONTROL = os.environ.get('QR_DOWNLOAD_CACHE_CONTROL', 'private, max-age=3600')
+
+class ScanEntry(NamedTuple):
+    response: QRScanResponse
+    etag: str
+    last_modified: Optional[datetime]
+
+def revision_etag(pet_id: str, revision: int, kind: str = "pet") -> str:
+    """Strong ETag for a representation of a pet at a given revision"""
+    return f'"{pet_id}-{kind}-r{revision or 0}"'
+
+def last_modified_of(pet_doc: dict) -> Optional[datetime]:
+    stamp = pet_doc.get("updated_at") or pet_doc.get("created_at")
+    if stamp is None:
+        return None
+    # Motor hands back naive UTC datetimes
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=timezone.utc)
+    return stamp.replace(microsecond=0)
+
+def conditional_headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since per RFC 9110 precedence"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def load_scan_entry(pet_id: str) -> Optional[ScanEntry]:
+    """Read the public scan view of a pet straight from a projection"""
+    pet_doc = await db.pets.find_one({"pet_id": pet_id}, SCAN_PROJECTION)
+    if not pet_doc:
+        return None
+    
+    owner = pet_doc.get("owner") or {}
+    variants = pet_doc.get("photo_variants") or {}
+    response = QRScanResponse(
+        pet_name=pet_doc["name"],
+        pet_photo_url=variants.get("scan") or pet_doc.get("photo_url"),
+        owner_name=owner["name"],
+        owner_mobile=owner["mobile"]
+    )
+    return ScanEntry(
+        response=response,
+        etag=revision_etag(pet_id, pet_doc.get("revision", 0)),
+        last_modified=last_modified_of(pet_doc)
+    )
+
 @api_router.get("/scan/{pet_id}")
-async def scan_qr_code(pet_id: str):
+async def scan_qr_code(pet_id: str, request: Request):
     """Get pet info for QR code scan - public endpoint"""
     try:
-        pet_doc = await db.pets.find_one({"pet_id": pet_id})
-        if not pet_doc:
-            raise HTTPException(status_code=404, detail="Pet not found")
+        entry = scan_cache.get(pet_id)
         
-        pet = Pet(**pet_doc)
+        if entry is None:
+            if not pet_id_filter.might_exist(pet_id) or scan_negative_cache.get(pet_id):
+                pet_id_filter.rejections += 1
+                raise HTTPException(status_code=404, detail="Pet not found")
+            
+            token = scan_cache.write_token()
+            negative_token = scan_negative_cache.write_token()
+            entry = await scan_flight.do(pet_id, lambda: load_scan_entry(pet_id))
+            if entry is None:
+                scan_negative_cache.set(pet_id, True, token=negative_token)
+                raise HTTPException(status_code=404, detail="Pet not found")
+            
+            scan_cache.set(pet_id, entry, token=token)
         
-        return QRScanResponse(
-            pet_name=pet.name,
-            pet_photo_url=pet.photo_url,
-            owner_name=pet.owner.name,
-            owner_mobile=pet.owner.mobile
-        )
+        headers = conditional_headers(entry.etag, entry.last_modified, SCAN_CACHE_CONTROL)
+        if is_not_modified(request, entry.etag, entry.last_modified):
+            return Response(status_code=304, headers=headers)
         
+        return JSONResponse(content=entry.response.dict(), headers=headers)
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error scanning QR code: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -487,23 +1674,26 @@ async def customer_login(login_data: CustomerLogin):
         logging.error(f"Error during customer login: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def load_customer_profile(owner_email: str) -> CustomerProfile:
+    pets_docs = await db.pets.find({"owner.email": owner_email}).to_list(100)
+    pets = [Pet(**pet) for pet in pets_docs]
+    
+    total_pets = len(pets)
+    active_payments = len([p for p in pets if p.payment_status == "paid"])
+    total_donations = sum(p.monthly_fee for p in pets if p.payment_status == "paid")
+    
+    return CustomerProfile(
+        pets=pets,
+        total_pets=total_pets,
+        active_payments=active_payments,
+        total_donations=total_donations
+    )
+
 @api_router.get("/customer/profile")
 async def get_customer_profile(current_customer: str = Depends(get_current_customer)):
     """Get customer profile with all pets"""
     try:
-        pets_docs = await db.pets.find({"owner.email": current_customer}).to_list(100)
-        pets = [Pet(**pet) for pet in pets_docs]
-        
-        total_pets = len(pets)
-        active_payments = len([p for p in pets if p.payment_status == "paid"])
-        total_donations = sum(p.monthly_fee for p in pets if p.payment_status == "paid")
-        
-        return CustomerProfile(
-            pets=pets,
-            total_pets=total_pets,
-            active_payments=active_payments,
-            total_donations=total_donations
-        )
+        return await profile_flight.do(current_customer, lambda: load_customer_profile(current_customer))
         
     except Exception as e:
         logging.error(f"Error getting customer profile: {str(e)}")
@@ -532,8 +1722,10 @@ async def update_pet(
         if update_fields:
             await db.pets.update_one(
                 {"pet_id": pet_id},
-                {"$set": update_fields}
+                with_revision({"$set": update_fields})
             )
+            invalidate_scan_views(pet_id)
+            profile_flight.forget(current_customer)
         
         return {"success": True, "message": "Pet updated successfully"}
         
@@ -557,8 +1749,9 @@ async def update_customer_profile(
         if update_fields:
             result = await db.pets.update_many(
                 {"owner.email": current_customer},
-                {"$set": update_fields}
+                with_revision({"$set": update_fields})
             )
+            await invalidate_owner_scan_cache(current_customer)
             
             return {"success": True, "updated_pets": result.modified_count}
         
@@ -593,6 +1786,7 @@ async def request_tag_replacement(
         )
         
         await db.tag_replacements.insert_one(replacement.dict())
+        await increment_stats({"replacement_orders": 1})
         
         return {
             "success": True,
@@ -607,19 +1801,25 @@ async def request_tag_replacement(
 @api_router.get("/customer/download-qr/{pet_id}")
 async def download_qr_code(
     pet_id: str,
+    request: Request,
     current_customer: str = Depends(get_current_customer)
 ):
     """Download QR code for customer's pet"""
     try:
         # Verify ownership
-        pet_doc = await db.pets.find_one({
-            "pet_id": pet_id,
-            "owner.email": current_customer
-        })
+        pet_doc = await db.pets.find_one(
+            {"pet_id": pet_id, "owner.email": current_customer},
+            {"_id": 0, "revision": 1, "updated_at": 1, "created_at": 1}
+        )
         
         if not pet_doc:
             raise HTTPException(status_code=404, detail="Pet not found or not owned by customer")
         
+        etag = revision_etag(pet_id, pet_doc.get("revision", 0), kind="qr")
+        headers = conditional_headers(etag, last_modified_of(pet_doc), QR_DOWNLOAD_CACHE_CONTROL)
+        if is_not_modified(request, etag, last_modified_of(pet_doc)):
+            return Response(status_code=304, headers=headers)
+        
         qr_path = qr_codes_dir / f"{pet_id}_qr.png"
         if not qr_path.exists():
             raise HTTPException(status_code=404, detail="QR code file not found")
@@ -627,9 +1827,12 @@ async def download_qr_code(
         return FileResponse(
             path=str(qr_path),
             filename=f"{pet_id}_qr_code.png",
-            media_type="image/png"
+            media_type="image/png",
+            headers=headers
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error downloading QR code: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -645,152 +1848,808 @@ async def admin_login(token: str):
     except HTTPException:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+# Count pets by payment and tag status server-side in one pass
+ADMIN_STATS_PIPELINE = [
+    {"$project": {"_id": 0, "payment_status": 1, "tag_status": 1}},
+    {"$facet": {
+        "total": [{"$count": "count"}],
+        "payment_status": [{"$group": {"_id": "$payment_status", "count": {"$sum": 1}}}],
+        "tag_status": [{"$group": {"_id": "$tag_status", "count": {"$sum": 1}}}]
+    }}
+]
+
+async def compute_stats_snapshot() -> dict:
+    """Recount everything the stats counters track with one aggregation"""
+    facets = (await db.pets.aggregate(ADMIN_STATS_PIPELINE).to_list(1))[0]
+    return {
+        "total_pets": facets["total"][0]["count"] if facets["total"] else 0,
+        "payment_status": {stats_value_key(group["_id"]): group["count"] for group in facets["payment_status"]},
+        "tag_status": {stats_value_key(group["_id"]): group["count"] for group in facets["tag_status"]},
+        "replacement_orders": await db.tag_replacements.count_documents({})
+    }
+
+def admin_stats_from_counters(counters: dict) -> AdminStats:
+    payment_counts = counters.get("payment_status", {})
+    tag_counts = counters.get("tag_status", {})
+    
+    pets_paid = payment_counts.get("paid", 0)
+    monthly_revenue = pets_paid * 2.0
+    
+    return AdminStats(
+        total_pets=counters.get("total_pets", 0),
+        pets_paid=pets_paid,
+        pets_in_arrears=payment_counts.get("arrears", 0),
+        tags_ordered=tag_counts.get("ordered", 0),
+        tags_printed=tag_counts.get("printed", 0),
+        tags_manufactured=tag_counts.get("manufactured", 0),
+        tags_shipped=tag_counts.get("shipped", 0),
+        tags_delivered=tag_counts.get("delivered", 0),
+        monthly_revenue=monthly_revenue,
+        total_revenue=monthly_revenue,
+        replacement_orders=counters.get("replacement_orders", 0)
+    )
+
+def flatten_counters(counters: dict) -> Dict[str, int]:
+    flat = {}
+    for key in ("total_pets", "replacement_orders"):
+        flat[key] = counters.get(key, 0)
+    for field in ("payment_status", "tag_status"):
+        for value, count in counters.get(field, {}).items():
+            flat[f"{field}.{value}"] = count
+    return flat
+
+async def reconcile_stats_counters(repair: bool = True) -> dict:
+    """Recompute the counters from scratch and report (and optionally fix) drift"""
+    actual = await compute_stats_snapshot()
+    current = await db.stats_counters.find_one({"_id": STATS_COUNTERS_ID}) or {}
+    
+    actual_flat = flatten_counters(actual)
+    current_flat = flatten_counters(current)
+    drift = {
+        key: {"counter": current_flat.get(key, 0), "actual": actual_flat.get(key, 0)}
+        for key in sorted(set(actual_flat) | set(current_flat))
+        if current_flat.get(key, 0) != actual_flat.get(key, 0)
+    }
+    
+    if repair:
+        await db.stats_counters.replace_one(
+            {"_id": STATS_COUNTERS_ID},
+            {**actual, "reconciled_at": datetime.now(timezone.utc)},
+            upsert=True
+        )
+    
+    return {"drift": drift, "repaired": repair, "stats": admin_stats_from_counters(actual)}
+
+STATS_RECONCILE_INTERVAL_SECONDS = float(os.environ.get('STATS_RECONCILE_INTERVAL_SECONDS', '3600'))
+
+async def reconcile_stats_periodically():
+    while True:
+        await asyncio.sleep(STATS_RECONCILE_INTERVAL_SECONDS)
+        try:
+            result = await reconcile_stats_counters(repair=True)
+            if result["drift"]:
+                logging.warning(f"Stats counters drifted and were repaired: {result['drift']}")
+        except Exception as e:
+            logging.error(f"Error reconciling stats counters: {str(e)}")
+
 @api_router.get("/admin/stats")
 async def get_admin_stats(token: str):
     """Get admin dashboard statistics"""
     verify_admin(token)
     try:
-        pets = await db.pets.find().to_list(10000)
-        replacements = await db.tag_replacements.find().to_list(10000)
-        
-        total_pets = len(pets)
-        pets_paid = len([p for p in pets if p.get('payment_status') == 'paid'])
-        pets_in_arrears = len([p for p in pets if p.get('payment_status') == 'arrears'])
-        
-        tags_ordered = len([p for p in pets if p.get('tag_status') == 'ordered'])
-        tags_printed = len([p for p in pets if p.get('tag_status') == 'printed'])
-        tags_manufactured = len([p for p in pets if p.get('tag_status') == 'manufactured'])
-        tags_shipped = len([p for p in pets if p.get('tag_status') == 'shipped'])
-        tags_delivered = len([p for p in pets if p.get('tag_status') == 'delivered'])
-        
-        monthly_revenue = pets_paid * 2.0
-        total_revenue = monthly_revenue
-        replacement_orders = len(replacements)
-        
-        return AdminStats(
-            total_pets=total_pets,
-            pets_paid=pets_paid,
-            pets_in_arrears=pets_in_arrears,
-            tags_ordered=tags_ordered,
-            tags_printed=tags_printed,
-            tags_manufactured=tags_manufactured,
-            tags_shipped=tags_shipped,
-            tags_delivered=tags_delivered,
-            monthly_revenue=monthly_revenue,
-            total_revenue=total_revenue,
-            replacement_orders=replacement_orders
-        )
+        counters = await db.stats_counters.find_one({"_id": STATS_COUNTERS_ID})
+        if counters is None or "reconciled_at" not in counters:
+            # Never seeded: build the counters from scratch once
+            return (await reconcile_stats_counters(repair=True))["stats"]
+        return admin_stats_from_counters(counters)
         
     except Exception as e:
         logging.error(f"Error getting admin stats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/admin/photos/generate-variants")
+async def backfill_photo_variants(token: str, background_tasks: BackgroundTasks, limit: int = 500):
+    """Queue photo variant generation for pets that do not have variants yet"""
+    verify_admin(token)
+    try:
+        pets = await db.pets.find(
+            {"photo_url": {"$ne": None}, "photo_variants": None},
+            {"_id": 0, "pet_id": 1, "photo_url": 1}
+        ).to_list(limit)
+        
+        for pet_doc in pets:
+            photo_path = uploads_dir / Path(pet_doc["photo_url"]).name
+            background_tasks.add_task(generate_photo_variants, pet_doc["pet_id"], photo_path)
+        
+        return {"success": True, "queued": len(pets)}
+        
+    except Exception as e:
+        logging.error(f"Error queueing photo variants: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/admin/stats/reconcile")
+async def reconcile_admin_stats(token: str, repair: bool = True):
+    """Recompute dashboard counters from scratch and report drift"""
+    verify_admin(token)
+    try:
+        return await reconcile_stats_counters(repair=repair)
+    except Exception as e:
+        logging.error(f"Error reconciling admin stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/admin/cache/stats")
+async def get_cache_stats(token: str):
+    """Get hit/miss/eviction counters for the in-process caches"""
+    verify_admin(token)
+    return {
+        "scan": scan_cache.stats(),
+        "scan_negative": scan_negative_cache.stats(),
+        "pet_id_filter": pet_id_filter.stats(),
+        "scan_single_flight": scan_flight.stats(),
+        "profile_single_flight": profile_flight.stats()
+    }
+
+@api_router.get("/admin/email/metrics")
+async def get_email_metrics(token: str):
+    """Get email outbox backlog, dispatch counters and today's quota use"""
+    verify_admin(token)
+    try:
+        outbox = {}
+        for status in ("pending", "sending", "sent", "failed"):
+            outbox[status] = await db.email_outbox.count_documents({"status": status})
+        remaining = await email_quota_remaining()
+        return {
+            "outbox": outbox,
+            "dispatch": email_metrics.stats(),
+            "smtp_pool": {"sessions_opened": smtp_pool.sessions_opened, "messages_sent": smtp_pool.messages_sent},
+            "daily_quota": {"day": email_quota_day(), "cap": EMAIL_DAILY_CAP, "used": EMAIL_DAILY_CAP - remaining, "remaining": remaining},
+            "rate_per_minute": EMAIL_RATE_PER_MINUTE
+        }
+    except Exception as e:
+        logging.error(f"Error getting email metrics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+REMINDER_STAMP_BATCH_SIZE = 1000
+
 @api_router.post("/admin/automation/send-payment-reminders")
-async def send_payment_reminders(token: str, background_tasks: BackgroundTasks):
-    """Send payment reminder emails to customers in arrears"""
+async def send_payment_reminders(token: str):
+    """Send payment reminder emails to customers in arrears, one per owner"""
     verify_admin(token)
     try:
-        arrears_pets = await db.pets.find({"payment_status": "arrears"}).to_list(1000)
-        
-        sent_count = 0
-        for pet_doc in arrears_pets:
-            pet = Pet(**pet_doc)
-            # Send reminder email
-            await send_payment_reminder(pet, background_tasks)
-            sent_count += 1
-            
-            # Update last email sent timestamp
-            await db.pets.update_one(
-                {"pet_id": pet.pet_id},
-                {"$set": {"last_email_sent": datetime.now(timezone.utc)}}
+        sent_count, pet_ids = await send_payment_reminders_to_owners({"payment_status": "arrears"})
+        
+        # Update last email sent timestamp
+        for offset in range(0, len(pet_ids), REMINDER_STAMP_BATCH_SIZE):
+            await db.pets.update_many(
+                {"pet_id": {"$in": pet_ids[offset:offset + REMINDER_STAMP_BATCH_SIZE]}},
+                with_revision({"$set": {"last_email_sent": datetime.now(timezone.utc)}})
             )
+        invalidate_scan_views(*pet_ids)
         
         return {
             "success": True,
             "reminders_sent": sent_count,
-            "message": f"Sent {sent_count} payment reminder emails"
+            "pets_reminded": len(pet_ids),
+            "message": f"Sent {sent_count} payment reminder emails covering {len(pet_ids)} pets"
         }
         
     except Exception as e:
         logging.error(f"Error sending payment reminders: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def annual_adjustment_filter(year: int) -> dict:
+    """Paid pets that haven't had this year's adjustment"""
+    return {
+        "payment_status": "paid",
+        "$or": [
+            {"annual_adjustment_date": {"$exists": False}},
+            {"annual_adjustment_date": {"$lt": datetime(year, 1, 1)}}
+        ]
+    }
+
+def adjusted_fee_expression(percentage: float) -> dict:
+    """round(fee * (1 + pct/100), 2) evaluated by MongoDB"""
+    return {"$round": [{"$multiply": [{"$ifNull": ["$monthly_fee", 2.0]}, 1 + percentage / 100]}, 2]}
+
+# Fee adjustments run as background jobs over pet_id ranges. The job record
+# in fee_adjustments (_id = adjustment_id) holds the last_pet_id checkpoint
+# and a lease; whoever holds the lease advances the checkpoint after every
+# chunk. The per-pet annual_adjustment_date filter makes a replayed chunk a
+# no-op, so a crash between a chunk and its checkpoint never double-applies.
+FEE_ADJUSTMENT_CHUNK_SIZE = int(os.environ.get('FEE_ADJUSTMENT_CHUNK_SIZE', '5000'))
+FEE_ADJUSTMENT_LEASE_SECONDS = int(os.environ.get('FEE_ADJUSTMENT_LEASE_SECONDS', '60'))
+LEASE_EXPIRED = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def fee_adjustment_progress(job: dict) -> dict:
+    return {
+        "adjustment_id": job["_id"],
+        "status": job["status"],
+        "year": job["year"],
+        "percentage": job["percentage"],
+        "affected_pets": job["affected_pets"],
+        "total_pets": job["total_pets"],
+        "last_pet_id": job["last_pet_id"],
+        "applied_date": job["applied_date"],
+        "completed_at": job.get("completed_at"),
+        "error": job.get("error"),
+        "progress_url": f"/api/admin/automation/annual-fee-adjustment/{job['_id']}"
+    }
+
+def lease_is_live(job: dict) -> bool:
+    lease_expires_at = job.get("lease_expires_at") or LEASE_EXPIRED
+    if lease_expires_at.tzinfo is None:
+        lease_expires_at = lease_expires_at.replace(tzinfo=timezone.utc)
+    return lease_expires_at > datetime.now(timezone.utc)
+
+async def claim_fee_adjustment(adjustment_id: str, lease_token: str) -> Optional[dict]:
+    now = datetime.now(timezone.utc)
+    return await db.fee_adjustments.find_one_and_update(
+        {"_id": adjustment_id, "status": "running", "lease_expires_at": {"$lt": now}},
+        {"$set": {
+            "lease_token": lease_token,
+            "lease_expires_at": now + timedelta(seconds=FEE_ADJUSTMENT_LEASE_SECONDS)
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def run_fee_adjustment(adjustment_id: str):
+    """Work a fee adjustment job to completion from its last checkpoint.
+
+    Waits out another holder's lease; returns once the job is no longer
+    running or the lease is lost to someone else.
+    """
+    lease_token = uuid.uuid4().hex
+    while True:
+        job = await claim_fee_adjustment(adjustment_id, lease_token)
+        if job is not None:
+            break
+        current = await db.fee_adjustments.find_one({"_id": adjustment_id}, {"status": 1})
+        if current is None or current.get("status") != "running":
+            return
+        await asyncio.sleep(FEE_ADJUSTMENT_LEASE_SECONDS / 2)
+    
+    holder = {"_id": adjustment_id, "lease_token": lease_token}
+    pet_filter = annual_adjustment_filter(job["year"])
+    pipeline = [
+        {"$set": {
+            "monthly_fee": adjusted_fee_expression(job["percentage"]),
+            "annual_adjustment_date": "$$NOW",
+            "updated_at": "$$NOW",
+            "revision": {"$add": [{"$ifNull": ["$revision", 0]}, 1]}
+        }}
+    ]
+    last_pet_id = job["last_pet_id"]
+    try:
+        while True:
+            chunk = await db.pets.find(
+                {**pet_filter, "pet_id": {"$gt": last_pet_id}},
+                {"_id": 0, "pet_id": 1}
+            ).sort("pet_id", ASCENDING).limit(FEE_ADJUSTMENT_CHUNK_SIZE).to_list(FEE_ADJUSTMENT_CHUNK_SIZE)
+            if not chunk:
+                break
+            
+            pet_ids = [pet_doc["pet_id"] for pet_doc in chunk]
+            result = await db.pets.update_many(
+                {**pet_filter, "pet_id": {"$gt": last_pet_id, "$lte": pet_ids[-1]}},
+                pipeline
+            )
+            # Every adjusted pet has a new revision, so cached ETags are stale
+            invalidate_scan_views(*pet_ids)
+            
+            checkpoint = await db.fee_adjustments.update_one(holder, {
+                "$set": {
+                    "last_pet_id": pet_ids[-1],
+                    "lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=FEE_ADJUSTMENT_LEASE_SECONDS)
+                },
+                "$inc": {"affected_pets": result.modified_count}
+            })
+            if checkpoint.matched_count == 0:
+                logging.warning(f"Fee adjustment {adjustment_id} lease lost at {last_pet_id}; stopping")
+                return
+            last_pet_id = pet_ids[-1]
+        
+        await db.fee_adjustments.update_one(holder, {"$set": {
+            "status": "completed",
+            "completed_at": datetime.now(timezone.utc),
+            "lease_expires_at": LEASE_EXPIRED
+        }})
+    except asyncio.CancelledError:
+        # Shutting down: hand the lease back so the next startup resumes at once
+        await db.fee_adjustments.update_one(holder, {"$set": {"lease_expires_at": LEASE_EXPIRED}})
+        raise
+    except Exception as e:
+        logging.error(f"Error applying fee adjustment {adjustment_id}: {str(e)}")
+        await db.fee_adjustments.update_one(holder, {"$set": {
+            "status": "failed",
+            "error": str(e),
+            "lease_expires_at": LEASE_EXPIRED
+        }})
+
+def start_fee_adjustment_job(adjustment_id: str):
+    job = asyncio.create_task(run_fee_adjustment(adjustment_id))
+    background_jobs.append(job)
+    job.add_done_callback(lambda done: background_jobs.remove(done) if done in background_jobs else None)
+
 @api_router.post("/admin/automation/annual-fee-adjustment")
-async def apply_annual_fee_adjustment(token: str, percentage: float):
-    """Apply annual fee adjustment to all active pets"""
+async def apply_annual_fee_adjustment(token: str, percentage: float, dry_run: bool = False):
+    """Apply annual fee adjustment to all active pets.
+
+    Starts (or resumes) a chunked background job and returns its progress
+    straight away; poll the progress_url until status is completed. With
+    dry_run the same filter and fee expression are aggregated instead,
+    reporting how many pets would change and the monthly revenue delta.
+    """
     verify_admin(token)
     try:
         current_year = datetime.now().year
         adjustment_id = f"ADJ{current_year}_{int(percentage*100)}"
+        pet_filter = annual_adjustment_filter(current_year)
+        
+        if dry_run:
+            totals = await db.pets.aggregate([
+                {"$match": pet_filter},
+                {"$group": {
+                    "_id": None,
+                    "affected_pets": {"$sum": 1},
+                    "current_revenue": {"$sum": {"$ifNull": ["$monthly_fee", 2.0]}},
+                    "adjusted_revenue": {"$sum": adjusted_fee_expression(percentage)}
+                }}
+            ]).to_list(1)
+            totals = totals[0] if totals else {"affected_pets": 0, "current_revenue": 0.0, "adjusted_revenue": 0.0}
+            affected_pets = totals["affected_pets"]
+            revenue_delta = round(totals["adjusted_revenue"] - totals["current_revenue"], 2)
+            return {
+                "success": True,
+                "dry_run": True,
+                "adjustment_id": adjustment_id,
+                "affected_pets": affected_pets,
+                "percentage": percentage,
+                "current_monthly_revenue": round(totals["current_revenue"], 2),
+                "adjusted_monthly_revenue": round(totals["adjusted_revenue"], 2),
+                "monthly_revenue_delta": revenue_delta,
+                "message": f"Would apply {percentage}% fee increase to {affected_pets} pets (R{revenue_delta:.2f}/month)"
+            }
         
-        # Get all pets that haven't had this year's adjustment
-        pets = await db.pets.find({
-            "payment_status": "paid",
-            "$or": [
-                {"annual_adjustment_date": {"$exists": False}},
-                {"annual_adjustment_date": {"$lt": datetime(current_year, 1, 1)}}
-            ]
-        }).to_list(10000)
-        
-        updated_count = 0
-        for pet_doc in pets:
-            pet = Pet(**pet_doc)
-            new_fee = round(pet.monthly_fee * (1 + percentage / 100), 2)
-            
-            await db.pets.update_one(
-                {"pet_id": pet.pet_id},
-                {
-                    "$set": {
-                        "monthly_fee": new_fee,
-                        "annual_adjustment_date": datetime.now(timezone.utc)
-                    }
-                }
+        job = await db.fee_adjustments.find_one({"_id": adjustment_id})
+        if job is None:
+            adjustment = FeeAdjustment(
+                adjustment_id=adjustment_id,
+                year=current_year,
+                percentage=percentage,
+                new_fee=2.0 * (1 + percentage / 100),  # Base fee adjusted
+                applied_date=datetime.now(timezone.utc),
+                affected_pets=0,
+                total_pets=await db.pets.count_documents(pet_filter)
             )
-            updated_count += 1
-        
-        # Record the adjustment
-        adjustment = FeeAdjustment(
-            adjustment_id=adjustment_id,
-            year=current_year,
-            percentage=percentage,
-            new_fee=2.0 * (1 + percentage / 100),  # Base fee adjusted
-            applied_date=datetime.now(timezone.utc),
-            affected_pets=updated_count
-        )
+            job = {"_id": adjustment_id, **adjustment.dict(), "lease_expires_at": LEASE_EXPIRED}
+            try:
+                await db.fee_adjustments.insert_one(job)
+            except DuplicateKeyError:
+                job = await db.fee_adjustments.find_one({"_id": adjustment_id})
+        
+        if job["status"] == "completed":
+            return {
+                "success": True,
+                "dry_run": False,
+                **fee_adjustment_progress(job),
+                "message": f"{percentage}% fee increase was already applied to {job['affected_pets']} pets"
+            }
         
-        await db.fee_adjustments.insert_one(adjustment.dict())
+        if job["status"] == "failed" or not lease_is_live(job):
+            job = await db.fee_adjustments.find_one_and_update(
+                {"_id": adjustment_id, "status": {"$ne": "completed"}},
+                {"$set": {"status": "running", "error": None}},
+                return_document=ReturnDocument.AFTER
+            ) or job
+            start_fee_adjustment_job(adjustment_id)
         
         return {
             "success": True,
-            "adjustment_id": adjustment_id,
-            "affected_pets": updated_count,
-            "percentage": percentage,
-            "message": f"Applied {percentage}% fee increase to {updated_count} pets"
+            "dry_run": False,
+            **fee_adjustment_progress(job),
+            "message": f"Applying {percentage}% fee increase to {job['total_pets']} pets"
         }
         
     except Exception as e:
         logging.error(f"Error applying fee adjustment: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/admin/automation/annual-fee-adjustment/{adjustment_id}")
+async def get_fee_adjustment_progress(adjustment_id: str, token: str):
+    """Report how far a fee adjustment job has got"""
+    verify_admin(token)
+    try:
+        job = await db.fee_adjustments.find_one({"_id": adjustment_id})
+        if not job:
+            raise HTTPException(status_code=404, detail="Fee adjustment not found")
+        return fee_adjustment_progress(job)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting fee adjustment progress: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Keyset pagination for admin pet lists
+ADMIN_PAGE_DEFAULT_LIMIT = 100
+ADMIN_PAGE_MAX_LIMIT = 500
+# Sort name -> key fields; pet_id is always last so keys are unique
+PET_PAGE_SORTS = {
+    "pet_id": ["pet_id"],
+    "created_at": ["created_at", "pet_id"]
+}
+
+# Named column sets for the admin tables; fields= also takes a comma list
+PET_FIELD_SETS = {
+    "summary": ["pet_id", "name", "breed", "owner.name", "owner.email", "tag_status", "payment_status", "created_at"],
+    "print": ["pet_id", "name", "owner.name", "owner.address", "qr_code_url", "tag_status", "manufacturing_batch"],
+    "billing": ["pet_id", "owner.account_holder_name", "owner.bank_account_number", "owner.branch_code", "monthly_fee", "payment_status"]
+}
+PET_SELECTABLE_FIELDS = set(PetSummary.__fields__) - {"owner"} | {f"owner.{field}" for field in OwnerSummary.__fields__}
+
+def parse_pet_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Resolve a fields= value (set name or comma list) into field paths"""
+    if not fields:
+        return None
+    if fields in PET_FIELD_SETS:
+        return PET_FIELD_SETS[fields]
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in PET_SELECTABLE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+def encode_page_cursor(sort: str, pet_doc: dict) -> str:
+    keys = [pet_doc.get(field) for field in PET_PAGE_SORTS[sort]]
+    payload = json.dumps({"s": sort, "k": [k.isoformat() if isinstance(k, datetime) else k for k in keys]})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_page_cursor(sort: str, cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if payload["s"] != sort or len(payload["k"]) != len(PET_PAGE_SORTS[sort]):
+            raise ValueError("cursor does not match sort")
+        return [
+            datetime.fromisoformat(value) if field == "created_at" else value
+            for field, value in zip(PET_PAGE_SORTS[sort], payload["k"])
+        ]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(fields: List[str], values: list) -> dict:
+    """Filter for documents strictly after values in (fields...) ascending order"""
+    clauses = []
+    for i, field in enumerate(fields):
+        clause = {prior: values[j] for j, prior in enumerate(fields[:i])}
+        clause[field] = {"$gt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+async def estimate_pet_count(query: dict) -> Optional[int]:
+    """Cheap total for a list filter: collection metadata or the stats counters"""
+    if not query:
+        return await db.pets.estimated_document_count()
+    if len(query) == 1:
+        field, value = next(iter(query.items()))
+        if field in ("payment_status", "tag_status") and isinstance(value, str):
+            counters = await db.stats_counters.find_one({"_id": STATS_COUNTERS_ID}, {field: 1})
+            if counters is not None:
+                return counters.get(field, {}).get(stats_value_key(value), 0)
+    return None
+
+async def paginate_pets(query: dict, sort: str, limit: int, cursor: Optional[str], fields: Optional[List[str]] = None) -> dict:
+    if sort not in PET_PAGE_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(PET_PAGE_SORTS)}")
+    limit = max(1, min(limit, ADMIN_PAGE_MAX_LIMIT))
+    sort_fields = PET_PAGE_SORTS[sort]
+    
+    page_query = query
+    if cursor:
+        after = keyset_filter(sort_fields, decode_page_cursor(sort, cursor))
+        page_query = {"$and": [query, after]} if query else after
+    
+    projection = None
+    if fields is not None:
+        # Sort keys are always needed to build the next cursor
+        projection = {"_id": 0, **{field: 1 for field in set(fields) | set(sort_fields)}}
+    
+    # Fetch one extra document to learn whether another page exists
+    pet_docs = await db.pets.find(page_query, projection).sort([(field, ASCENDING) for field in sort_fields]).limit(limit + 1).to_list(limit + 1)
+    has_more = len(pet_docs) > limit
+    pet_docs = pet_docs[:limit]
+    
+    if fields is None:
+        items = [Pet(**pet) for pet in pet_docs]
+    else:
+        items = [PetSummary(**pet).dict(exclude_unset=True) for pet in pet_docs]
+    
+    return {
+        "items": items,
+        "next_cursor": encode_page_cursor(sort, pet_docs[-1]) if has_more else None,
+        "total_estimate": await estimate_pet_count(query)
+    }
+
 @api_router.get("/admin/pets")
-async def get_all_pets(token: str):
-    """Admin endpoint to get all pets"""
+async def get_all_pets(
+    token: str,
+    limit: int = ADMIN_PAGE_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+    sort: str = "pet_id",
+    tag_status: Optional[str] = None,
+    payment_status: Optional[str] = None,
+    owner_email: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Admin endpoint to page through pets; follow next_cursor for more.
+
+    fields= limits each item to a named set (summary, print, billing) or a
+    comma-separated list of field paths such as pet_id,name,owner.email.
+    """
     verify_admin(token)
     try:
-        pets = await db.pets.find().to_list(1000)
-        return [Pet(**pet) for pet in pets]
+        query = {}
+        if tag_status:
+            query["tag_status"] = tag_status
+        if payment_status:
+            query["payment_status"] = payment_status
+        if owner_email:
+            query["owner.email"] = owner_email
+        
+        return await paginate_pets(query, sort, limit, cursor, parse_pet_fields(fields))
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error getting pets: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Streaming export of the full registry
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+BANK_DETAIL_FIELDS = ["owner.bank_account_number", "owner.branch_code", "owner.account_holder_name"]
+EXPORT_CSV_COLUMNS = [
+    "pet_id", "name", "breed", "medical_info", "instructions", "photo_url", "qr_code_url",
+    "owner.name", "owner.mobile", "owner.email", "owner.address",
+    "owner.bank_account_number", "owner.branch_code", "owner.account_holder_name",
+    "tag_status", "payment_status", "monthly_fee", "created_at", "last_payment",
+    "manufacturing_batch", "shipping_tracking", "delivered_date", "replacement_count",
+    "annual_adjustment_date", "last_email_sent", "revision", "updated_at"
+]
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return json.dumps(value, default=export_value)
+    return value
+
+def dotted_get(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+async def stream_pet_export(export_format: str, include_bank_details: bool):
+    """Yield the registry as NDJSON or CSV, one encoded chunk per cursor batch"""
+    projection = {"_id": 0}
+    columns = EXPORT_CSV_COLUMNS
+    if not include_bank_details:
+        projection.update({field: 0 for field in BANK_DETAIL_FIELDS})
+        columns = [column for column in EXPORT_CSV_COLUMNS if column not in BANK_DETAIL_FIELDS]
+    
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        writer.writerow(columns)
+    
+    rows = 0
+    cursor = db.pets.find({}, projection).sort("pet_id", ASCENDING).batch_size(EXPORT_BATCH_SIZE)
+    async for pet_doc in cursor:
+        if export_format == "csv":
+            writer.writerow([export_value(dotted_get(pet_doc, column)) for column in columns])
+        else:
+            buffer.write(json.dumps(pet_doc, default=export_value))
+            buffer.write("\n")
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+@api_router.get("/admin/pets/export")
+async def export_pets(token: str, format: str = "ndjson", include_bank_details: bool = False):
+    """Stream every pet as NDJSON or CSV without loading the registry into memory"""
+    verify_admin(token)
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    
+    filename = f"pets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        stream_pet_export(format, include_bank_details),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Bulk import (partner shelters)
+BULK_REGISTER_MAX_ROWS = int(os.environ.get('BULK_REGISTER_MAX_ROWS', '10000'))
+
+def parse_bulk_rows(fileobj, filename: str) -> List[dict]:
+    """Parse an NDJSON (.ndjson/.jsonl) or CSV registration file into row dicts"""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        if filename.lower().endswith((".ndjson", ".jsonl")):
+            rows = []
+            for line in text:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    rows.append({"__error__": f"Invalid JSON: {str(e)}"})
+                    continue
+                if not isinstance(row, dict):
+                    row = {"__error__": "Each line must be a JSON object"}
+                rows.append(row)
+            return rows
+        rows = []
+        for row in csv.DictReader(text):
+            if None in row:
+                # DictReader files cells beyond the header under a None key
+                row = {"__error__": f"Row has {len(row[None])} more cells than the header"}
+            rows.append(dict(row))
+        return rows
+    finally:
+        text.detach()
+
+def extract_bulk_photos(archive_fileobj, wanted: Dict[str, str], max_bytes: int) -> Dict[str, tuple]:
+    """Extract archive members into uploads/ as {pet_id}_{name}.
+
+    wanted maps pet_id to member name; returns pet_id -> (photo_url, error).
+    """
+    results = {}
+    with zipfile.ZipFile(archive_fileobj) as archive:
+        for pet_id, member_name in wanted.items():
+            try:
+                info = archive.getinfo(member_name)
+            except KeyError:
+                results[pet_id] = (None, f"Photo {member_name} not in archive")
+                continue
+            if info.file_size > max_bytes:
+                results[pet_id] = (None, f"Photo {member_name} exceeds {max_bytes} bytes")
+                continue
+            
+            photo_filename = f"{pet_id}_{Path(member_name).name}"
+            tmp_path = tmp_dir / f"{uuid.uuid4().hex}.part"
+            with archive.open(info) as source, open(tmp_path, "wb") as target:
+                shutil.copyfileobj(source, target, UPLOAD_CHUNK_BYTES)
+            os.replace(tmp_path, uploads_dir / photo_filename)
+            results[pet_id] = (f"/uploads/{photo_filename}", None)
+    return results
+
+@api_router.post("/admin/pets/bulk-register")
+async def bulk_register_pets(
+    token: str,
+    pets_file: UploadFile = File(...),
+    photos_archive: Optional[UploadFile] = File(None),
+    send_emails: bool = False,
+    background_tasks: BackgroundTasks = BackgroundTasks()
+):
+    """Register many pets from a CSV/NDJSON file plus an optional zip of photos.
+
+    Rows use the PetRegistration fields, with an optional photo_filename
+    naming a member of photos_archive. Returns one result per row.
+    """
+    verify_admin(token)
+    try:
+        rows = await run_in_threadpool(parse_bulk_rows, pets_file.file, pets_file.filename or "")
+        if len(rows) > BULK_REGISTER_MAX_ROWS:
+            raise HTTPException(status_code=400, detail=f"At most {BULK_REGISTER_MAX_ROWS} rows per import")
+        
+        results = [BulkRegistrationRow(row=i + 1, success=False) for i in range(len(rows))]
+        valid = []
+        for i, row in enumerate(rows):
+            if "__error__" in row:
+                results[i].error = row["__error__"]
+                continue
+            try:
+                valid.append((i, PetRegistration(**row), str(row.get("photo_filename") or "").strip()))
+            except (ValidationError, TypeError) as e:
+                results[i].error = str(e)
+        
+        if not valid:
+            return {"success": False, "registered": 0, "failed": len(rows), "results": results}
+        
+        pet_ids = await pet_id_allocator.allocate(len(valid))
+        
+        photo_urls = {}
+        wanted_photos = {pet_id: photo for pet_id, (_, _, photo) in zip(pet_ids, valid) if photo}
+        if wanted_photos and photos_archive is not None:
+            photo_urls = await run_in_threadpool(
+                extract_bulk_photos, photos_archive.file, wanted_photos, MAX_PHOTO_UPLOAD_BYTES
+            )
+        
+        # Settle photo errors first so QR codes are only rendered for rows that will be inserted
+        accepted = []
+        for pet_id, (i, registration_data, photo) in zip(pet_ids, valid):
+            photo_url, photo_error = photo_urls.get(pet_id, (None, None))
+            if photo and photos_archive is None:
+                photo_error = "photo_filename given but no photos_archive uploaded"
+            if photo_error:
+                results[i].error = photo_error
+                continue
+            accepted.append((pet_id, i, registration_data, photo_url))
+        
+        qr_code_urls = await asyncio.gather(
+            *(generate_qr_code(pet_id) for pet_id, _, _, _ in accepted),
+            return_exceptions=True
+        )
+        
+        pets = []
+        for (pet_id, i, registration_data, photo_url), qr_code_url in zip(accepted, qr_code_urls):
+            if isinstance(qr_code_url, Exception):
+                results[i].error = f"QR generation failed: {str(qr_code_url)}"
+                continue
+            pets.append((i, build_registered_pet(pet_id, registration_data, photo_url, qr_code_url)))
+        
+        failed_indexes = set()
+        if pets:
+            try:
+                await db.pets.insert_many([pet.dict() for _, pet in pets], ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    failed_indexes.add(error["index"])
+                    results[pets[error["index"]][0]].error = error.get("errmsg", "Insert failed")
+        
+        inserted = [pet for position, (_, pet) in enumerate(pets) if position not in failed_indexes]
+        await count_new_pets(inserted)
+        
+        emails = []
+        for position, (i, pet) in enumerate(pets):
+            if position in failed_indexes:
+                continue
+            results[i].success = True
+            results[i].pet_id = pet.pet_id
+            results[i].qr_code_url = pet.qr_code_url
+            register_known_pet_id(pet.pet_id)
+            if pet.photo_url:
+                background_tasks.add_task(generate_photo_variants, pet.pet_id, uploads_dir / Path(pet.photo_url).name)
+            if send_emails:
+                emails.append(qr_code_email(pet))
+        await enqueue_emails(emails)
+        
+        registered = sum(1 for result in results if result.success)
+        return {
+            "success": True,
+            "registered": registered,
+            "failed": len(rows) - registered,
+            "results": results
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error bulk registering pets: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # TAG MANAGEMENT ENDPOINTS (existing ones remain the same)
 @api_router.get("/admin/tags/print-queue")
-async def get_print_queue(token: str):
-    """Get pets that need tags printed"""
+async def get_print_queue(
+    token: str,
+    limit: int = ADMIN_PAGE_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+    sort: str = "pet_id",
+    fields: Optional[str] = None
+):
+    """Get pets that need tags printed, one page at a time"""
     verify_admin(token)
     try:
-        pets = await db.pets.find({"tag_status": "ordered"}).to_list(1000)
-        return [Pet(**pet) for pet in pets]
+        return await paginate_pets({"tag_status": "ordered"}, sort, limit, cursor, parse_pet_fields(fields))
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error getting print queue: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -896,15 +2755,13 @@ async def create_manufacturing_batch(token: str, pet_ids: List[str], notes: Opti
         
         await db.manufacturing_batches.insert_one(batch.dict())
         
-        await db.pets.update_many(
+        await transition_pets(
             {"pet_id": {"$in": pet_ids}},
-            {
-                "$set": {
-                    "tag_status": "printed",
-                    "manufacturing_batch": batch_id
-                }
-            }
+            "tag_status",
+            "printed",
+            {"manufacturing_batch": batch_id}
         )
+        invalidate_scan_views(*pet_ids)
         
         return {
             "success": True,
@@ -918,7 +2775,7 @@ async def create_manufacturing_batch(token: str, pet_ids: List[str], notes: Opti
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/admin/tags/create-shipping-batch")
-async def create_shipping_batch(token: str, pet_ids: List[str], courier: str, tracking_number: Optional[str] = "", background_tasks: BackgroundTasks = BackgroundTasks()):
+async def create_shipping_batch(token: str, pet_ids: List[str], courier: str, tracking_number: Optional[str] = ""):
     """Create shipping batch for manufactured tags with email notifications"""
     verify_admin(token)
     try:
@@ -940,22 +2797,22 @@ async def create_shipping_batch(token: str, pet_ids: List[str], courier: str, tr
         
         await db.shipping_batches.insert_one(batch.dict())
         
-        await db.pets.update_many(
+        await transition_pets(
             {"pet_id": {"$in": pet_ids}},
-            {"$set": {"tag_status": "shipped", "shipping_tracking": tracking_number}}
+            "tag_status",
+            "shipped",
+            {"shipping_tracking": tracking_number}
         )
+        invalidate_scan_views(*pet_ids)
         
-        # Send shipping notifications
-        for pet_id in pet_ids:
-            pet_doc = await db.pets.find_one({"pet_id": pet_id})
-            if pet_doc:
-                pet = Pet(**pet_doc)
-                await send_shipping_notification(pet, courier, tracking_number, background_tasks)
+        # Send shipping notifications, one per owner
+        notifications_sent = await send_shipping_notifications(pet_ids, courier, tracking_number)
         
         return {
             "success": True,
             "shipping_id": shipping_id,
             "pet_count": len(pet_ids),
+            "notifications_sent": notifications_sent,
             "message": f"Shipping batch {shipping_id} created successfully"
         }
         
@@ -968,19 +2825,22 @@ async def bulk_update_tag_status(token: str, request: BulkTagUpdate):
     """Bulk update tag status for multiple pets"""
     verify_admin(token)
     try:
-        update_data = {"tag_status": request.new_status}
+        extra_set = {}
         if request.new_status == "delivered":
-            update_data["delivered_date"] = datetime.now(timezone.utc)
+            extra_set["delivered_date"] = datetime.now(timezone.utc)
         
-        result = await db.pets.update_many(
+        updated_count = await transition_pets(
             {"pet_id": {"$in": request.pet_ids}},
-            {"$set": update_data}
+            "tag_status",
+            request.new_status,
+            extra_set
         )
+        invalidate_scan_views(*request.pet_ids)
         
         return {
             "success": True,
-            "updated_count": result.modified_count,
-            "message": f"Updated {result.modified_count} pets to status: {request.new_status}"
+            "updated_count": updated_count,
+            "message": f"Updated {updated_count} pets to status: {request.new_status}"
         }
         
     except Exception as e:
@@ -992,16 +2852,14 @@ async def update_tag_status(token: str, update: TagUpdate):
     """Update tag status for individual pet"""
     verify_admin(token)
     try:
-        update_data = {"tag_status": update.status}
+        extra_set = {}
         if update.status == "delivered":
-            update_data["delivered_date"] = datetime.now(timezone.utc)
+            extra_set["delivered_date"] = datetime.now(timezone.utc)
         
-        result = await db.pets.update_one(
-            {"pet_id": update.pet_id},
-            {"$set": update_data}
-        )
+        previous = await transition_pet(update.pet_id, "tag_status", update.status, extra_set)
+        invalidate_scan_views(update.pet_id)
         
-        if result.modified_count == 0:
+        if previous is None:
             raise HTTPException(status_code=404, detail="Pet not found")
         
         return {"success": True, "message": f"Tag status updated to {update.status}"}
@@ -1029,18 +2887,10 @@ async def create_tag_replacement(token: str, original_pet_id: str, reason: str):
         )
         
         await db.tag_replacements.insert_one(replacement.dict())
+        await increment_stats({"replacement_orders": 1})
         
         # Generate new QR code
-        qr_url = f"{os.environ.get('FRONTEND_BASE_URL', 'http://localhost:3000')}/scan/{new_pet_id}"
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_url)
-        qr.make(fit=True)
-        
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_filename = f"{new_pet_id}_qr.png"
-        qr_path = qr_codes_dir / qr_filename
-        qr_img.save(qr_path)
-        qr_code_url = f"/qr_codes/{qr_filename}"
+        qr_code_url = await generate_qr_code(new_pet_id)
         
         new_pet = original_pet.copy()
         new_pet.pet_id = new_pet_id
@@ -1050,11 +2900,11 @@ async def create_tag_replacement(token: str, original_pet_id: str, reason: str):
         new_pet.created_at = datetime.now(timezone.utc)
         
         await db.pets.insert_one(new_pet.dict())
+        await count_new_pets([new_pet])
+        register_known_pet_id(new_pet_id)
         
-        await db.pets.update_one(
-            {"pet_id": original_pet_id},
-            {"$set": {"tag_status": "replaced"}}
-        )
+        await transition_pet(original_pet_id, "tag_status", "replaced")
+        invalidate_scan_views(original_pet_id, new_pet_id)
         
         return {
             "success": True,
@@ -1069,117 +2919,407 @@ async def create_tag_replacement(token: str, original_pet_id: str, reason: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 # BILLING ENDPOINTS (existing)
+BILLING_BATCH_SIZE = int(os.environ.get('BILLING_BATCH_SIZE', '1000'))
+BILLING_PROJECTION = {
+    "_id": 0,
+    "pet_id": 1,
+    "owner.account_holder_name": 1,
+    "owner.bank_account_number": 1,
+    "owner.branch_code": 1,
+    "monthly_fee": 1
+}
+
 @api_router.post("/admin/billing/generate-csv")
 async def generate_billing_csv(token: str):
-    """Generate monthly billing CSV for bank processing"""
+    """Generate monthly billing CSV for bank processing.
+
+    Streams every paid pet from a projected cursor, writing each batch off
+    the event loop while the row count, total and SHA-256 are accumulated
+    in the same pass. The file only appears under /billing once complete.
+    """
     verify_admin(token)
+    csv_filename = f"billing_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    tmp_path = tmp_dir / f"{uuid.uuid4().hex}.csv"
     try:
-        pets = await db.pets.find({"payment_status": "paid"}).to_list(1000)
-        
-        if not pets:
-            raise HTTPException(status_code=400, detail="No pets with paid status found")
-        
-        csv_filename = f"billing_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        csv_path = billing_dir / csv_filename
-        
-        with open(csv_path, "w", newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
+        checksum = hashlib.sha256()
+        row_count = 0
+        total_amount = Decimal("0")
+        
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        
+        async def flush(csvfile):
+            chunk = buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            checksum.update(chunk)
+            await run_in_threadpool(csvfile.write, chunk)
+        
+        csvfile = await run_in_threadpool(open, tmp_path, "wb")
+        try:
             writer.writerow(['Customer_ID', 'Account_Holder_Name', 'Account_Number', 'Branch_Code', 'Amount'])
             
-            for pet_doc in pets:
-                pet = Pet(**pet_doc)
+            cursor = db.pets.find({"payment_status": "paid"}, BILLING_PROJECTION).sort("pet_id", ASCENDING).batch_size(BILLING_BATCH_SIZE)
+            async for pet_doc in cursor:
+                owner = pet_doc.get("owner", {})
+                amount = f"{pet_doc.get('monthly_fee', 2.0):.2f}"
                 writer.writerow([
-                    pet.pet_id,
-                    pet.owner.account_holder_name,
-                    pet.owner.bank_account_number,
-                    pet.owner.branch_code,
-                    f"{pet.monthly_fee:.2f}"
+                    pet_doc["pet_id"],
+                    owner.get("account_holder_name"),
+                    owner.get("bank_account_number"),
+                    owner.get("branch_code"),
+                    amount
                 ])
+                row_count += 1
+                total_amount += Decimal(amount)
+                if row_count % BILLING_BATCH_SIZE == 0:
+                    await flush(csvfile)
+            
+            await flush(csvfile)
+        finally:
+            await run_in_threadpool(csvfile.close)
+        
+        if row_count == 0:
+            await run_in_threadpool(tmp_path.unlink, True)
+            raise HTTPException(status_code=400, detail="No pets with paid status found")
+        
+        await run_in_threadpool(os.replace, tmp_path, billing_dir / csv_filename)
         
         return {
             "success": True,
             "filename": csv_filename,
-            "total_amount": sum(Pet(**pet).monthly_fee for pet in pets),
-            "customer_count": len(pets),
+            "total_amount": float(total_amount),
+            "customer_count": row_count,
+            "row_count": row_count,
+            "sha256": checksum.hexdigest(),
             "download_url": f"/billing/{csv_filename}"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
+        await run_in_threadpool(tmp_path.unlink, True)
         logging.error(f"Error generating billing CSV: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Bank results are applied in chunks: one $in pre-read for the previous
+# statuses and one unordered bulk_write. Pets newly in arrears are kept on
+# the import record and reminded per owner once the whole file is in.
+PAYMENT_IMPORT_CHUNK_ROWS = int(os.environ.get('PAYMENT_IMPORT_CHUNK_ROWS', '1000'))
+PAID_RESULT_STATUSES = {'success', 'paid'}
+FAILED_RESULT_STATUSES = {'failed', 'declined'}
+
+# Every results file is fingerprinted by its SHA-256 in payment_imports
+# (_id, so uniqueness comes for free) with a committed_rows checkpoint, and
+# every applied row by a row key in payment_import_rows. A file uploaded
+# twice is answered from its record; an interrupted one resumes after the
+# last committed chunk; a row repeated in another file is skipped.
+PAYMENT_IMPORT_LEASE_SECONDS = int(os.environ.get('PAYMENT_IMPORT_LEASE_SECONDS', '300'))
+PAYMENT_ROW_KEY_COLUMNS = ('Reference', 'Date')
+# Row keys only need to outlive any chance of the bank resending a month's results
+PAYMENT_IMPORT_ROW_RETENTION_SECONDS = int(os.environ.get('PAYMENT_IMPORT_ROW_RETENTION_SECONDS', str(400 * 24 * 3600)))
+
+def read_csv_chunk(reader, size: int) -> list:
+    return list(islice(reader, size))
+
+def skip_csv_rows(reader, count: int):
+    next(islice(reader, count, count), None)
+
+def hash_upload(upload_file) -> str:
+    checksum = hashlib.sha256()
+    upload_file.seek(0)
+    for chunk in iter(lambda: upload_file.read(UPLOAD_CHUNK_BYTES), b""):
+        checksum.update(chunk)
+    upload_file.seek(0)
+    return checksum.hexdigest()
+
+def payment_row_key(row: dict, customer_id: str, status: str, file_hash: str) -> str:
+    """Identify a bank result row across files.
+
+    The bank's Reference/Date columns tell one month's result from the
+    next; a file without them only dedups rows within itself.
+    """
+    qualifiers = [(row.get(column) or '').strip() for column in PAYMENT_ROW_KEY_COLUMNS]
+    if not any(qualifiers):
+        qualifiers = [file_hash]
+    return hashlib.sha256("|".join([customer_id, status, *qualifiers]).encode("utf-8")).hexdigest()
+
+async def claim_payment_import(file_hash: str, filename: Optional[str]) -> Optional[dict]:
+    """Start or resume the import of one results file.
+
+    Returns the import record to work from, or None when the file was
+    already imported completely. Raises 409 while another request holds a
+    live lease on the same file.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        record = {
+            "_id": file_hash,
+            "filename": filename,
+            "status": "in_progress",
+            "committed_rows": 0,
+            "updated_count": 0,
+            "failed_count": 0,
+            "duplicate_rows": 0,
+            "reminder_pet_ids": [],
+            "started_at": now,
+            "heartbeat_at": now
+        }
+        await db.payment_imports.insert_one(record)
+        return record
+    except DuplicateKeyError:
+        pass
+    
+    record = await db.payment_imports.find_one_and_update(
+        {
+            "_id": file_hash,
+            "status": "in_progress",
+            "heartbeat_at": {"$lt": now - timedelta(seconds=PAYMENT_IMPORT_LEASE_SECONDS)}
+        },
+        {"$set": {"heartbeat_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+    if record is not None:
+        return record
+    
+    existing = await db.payment_imports.find_one({"_id": file_hash}, {"status": 1})
+    if existing is not None and existing.get("status") == "completed":
+        return None
+    raise HTTPException(status_code=409, detail="This results file is already being imported")
+
+async def unseen_payment_rows(row_keys: Dict[str, tuple]) -> Dict[str, tuple]:
+    """Drop rows whose key an earlier import already applied"""
+    seen = set()
+    async for row_doc in db.payment_import_rows.find({"_id": {"$in": list(row_keys)}}, {"_id": 1}):
+        seen.add(row_doc["_id"])
+    return {row_key: result for row_key, result in row_keys.items() if row_key not in seen}
+
+async def record_payment_rows(file_hash: str, row_keys: List[str]):
+    if not row_keys:
+        return
+    now = datetime.now(timezone.utc)
+    try:
+        await db.payment_import_rows.insert_many(
+            [{"_id": row_key, "import_id": file_hash, "created_at": now} for row_key in row_keys],
+            ordered=False
+        )
+    except BulkWriteError as e:
+        # Keys left over from a chunk that was applied but never checkpointed
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+async def plan_payment_results(results: Dict[str, str]):
+    """Work out the writes for one chunk of Customer_ID -> "paid"/"arrears" results.
+
+    Returns (operations, increments, updated_count, newly_failed): the pet
+    updates, the stats counter deltas, paid rows that matched a pet, and
+    the IDs of pets that newly move into arrears.
+    """
+    now = datetime.now(timezone.utc)
+    previous = {}
+    async for pet_doc in db.pets.find(
+        {"pet_id": {"$in": list(results)}},
+        {"_id": 0, "pet_id": 1, "payment_status": 1}
+    ):
+        previous[pet_doc["pet_id"]] = pet_doc.get("payment_status")
+    
+    operations = []
+    increments = {}
+    updated_count = 0
+    newly_failed = []
+    for pet_id, new_status in results.items():
+        if pet_id not in previous:
+            continue
+        old_status = previous[pet_id]
+        if new_status == "paid":
+            operations.append(UpdateOne(
+                {"pet_id": pet_id},
+                with_revision({"$set": {"payment_status": "paid", "last_payment": now}})
+            ))
+            updated_count += 1
+        else:
+            if old_status == "arrears":
+                continue
+            operations.append(UpdateOne(
+                {"pet_id": pet_id, "payment_status": {"$ne": "arrears"}},
+                with_revision({"$set": {"payment_status": "arrears"}})
+            ))
+            newly_failed.append(pet_id)
+        if old_status != new_status:
+            old_key = counter_key("payment_status", old_status)
+            new_key = counter_key("payment_status", new_status)
+            increments[old_key] = increments.get(old_key, 0) - 1
+            increments[new_key] = increments.get(new_key, 0) + 1
+    
+    return operations, increments, updated_count, newly_failed
+
+async def apply_payment_results(results: Dict[str, str], operations: list, increments: Dict[str, int]):
+    """Write a chunk planned by plan_payment_results"""
+    if operations:
+        await db.pets.bulk_write(operations, ordered=False)
+        await increment_stats(increments)
+        invalidate_scan_views(*results)
+
 @api_router.post("/admin/payments/import-results")
-async def import_payment_results(
-    token: str,
-    results_file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks()
-):
-    """Import payment results from bank processing"""
+async def import_payment_results(token: str, results_file: UploadFile = File(...)):
+    """Import payment results from bank processing.
+
+    The upload is parsed incrementally off the event loop and applied
+    PAYMENT_IMPORT_CHUNK_ROWS rows at a time, so memory stays flat however
+    large the bank's results file is. Re-uploading a file is a no-op and
+    an interrupted import picks up after its last committed chunk.
+    """
     verify_admin(token)
+    text = None
+    claimed_hash = None
     try:
-        content = await results_file.read()
-        csv_data = StringIO(content.decode('utf-8'))
+        file_hash = await run_in_threadpool(hash_upload, results_file.file)
+        record = await claim_payment_import(file_hash, results_file.filename)
+        if record is None:
+            record = await db.payment_imports.find_one({"_id": file_hash})
+            return {
+                "success": True,
+                "duplicate": True,
+                "import_id": file_hash,
+                "updated_count": record.get("updated_count", 0),
+                "failed_count": record.get("failed_count", 0),
+                "message": f"This results file was already imported on {record['completed_at'].strftime('%Y-%m-%d %H:%M')}; nothing was re-applied."
+            }
+        claimed_hash = file_hash
+        
+        text = io.TextIOWrapper(results_file.file, encoding="utf-8-sig", newline="")
+        reader = csv.DictReader(text)
+        committed_rows = record["committed_rows"]
+        interrupted = record.get("pending_chunk")
+        if committed_rows:
+            await run_in_threadpool(skip_csv_rows, reader, committed_rows)
+        
+        while True:
+            rows = await run_in_threadpool(read_csv_chunk, reader, PAYMENT_IMPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            
+            # Later rows for the same pet win, as they did row by row
+            row_keys = {}
+            for row in rows:
+                customer_id = (row.get('Customer_ID') or '').strip()
+                status = (row.get('Status') or '').strip().lower()
+                if not customer_id:
+                    continue
+                if status in PAID_RESULT_STATUSES:
+                    new_status = "paid"
+                elif status in FAILED_RESULT_STATUSES:
+                    new_status = "arrears"
+                else:
+                    continue
+                row_key = payment_row_key(row, customer_id, new_status, file_hash)
+                row_keys.pop(row_key, None)
+                row_keys[row_key] = (customer_id, new_status)
+            
+            unseen = await unseen_payment_rows(row_keys) if row_keys else {}
+            results = {}
+            for customer_id, new_status in unseen.values():
+                results.pop(customer_id, None)
+                results[customer_id] = new_status
+            
+            operations, increments, updated, newly_failed = [], {}, 0, []
+            if results:
+                operations, increments, updated, newly_failed = await plan_payment_results(results)
+            
+            # Note the chunk's outcome before writing anything. A replay after a
+            # crash sees its own earlier writes (pets already in arrears, rows
+            # already seen), so it must reuse these counts and reminders
+            if interrupted is not None and interrupted["start"] == committed_rows:
+                updated = interrupted["updated_count"]
+                newly_failed = sorted(set(interrupted["newly_failed"]) | set(newly_failed))
+                duplicate_rows = interrupted["duplicate_rows"]
+            else:
+                duplicate_rows = len(row_keys) - len(unseen)
+            await db.payment_imports.update_one(
+                {"_id": file_hash},
+                {"$set": {"pending_chunk": {
+                    "start": committed_rows,
+                    "updated_count": updated,
+                    "newly_failed": newly_failed,
+                    "duplicate_rows": duplicate_rows
+                }}}
+            )
+            
+            await apply_payment_results(results, operations, increments)
+            await record_payment_rows(file_hash, list(unseen))
+            
+            committed_rows += len(rows)
+            await db.payment_imports.update_one(
+                {"_id": file_hash},
+                {
+                    "$set": {"committed_rows": committed_rows, "heartbeat_at": datetime.now(timezone.utc)},
+                    "$unset": {"pending_chunk": ""},
+                    "$inc": {
+                        "updated_count": updated,
+                        "failed_count": len(newly_failed),
+                        "duplicate_rows": duplicate_rows
+                    },
+                    "$push": {"reminder_pet_ids": {"$each": newly_failed}}
+                }
+            )
         
-        reader = csv.DictReader(csv_data)
-        updated_count = 0
-        failed_count = 0
+        # Reminders go out once for the whole file, so an owner whose pets
+        # fall in different chunks still gets a single email
+        record = await db.payment_imports.find_one({"_id": file_hash}, {"reminder_pet_ids": 1})
+        reminder_pet_ids = record.get("reminder_pet_ids", [])
+        if reminder_pet_ids:
+            await send_payment_reminders_to_owners({"pet_id": {"$in": reminder_pet_ids}})
         
-        for row in reader:
-            customer_id = row.get('Customer_ID', '').strip()
-            status = row.get('Status', '').strip().lower()
-            
-            if customer_id and status in ['success', 'paid']:
-                result = await db.pets.update_one(
-                    {"pet_id": customer_id},
-                    {
-                        "$set": {
-                            "payment_status": "paid",
-                            "last_payment": datetime.now(timezone.utc)
-                        }
-                    }
-                )
-                if result.modified_count > 0:
-                    updated_count += 1
-            elif customer_id and status in ['failed', 'declined']:
-                result = await db.pets.update_one(
-                    {"pet_id": customer_id},
-                    {"$set": {"payment_status": "arrears"}}
-                )
-                if result.modified_count > 0:
-                    failed_count += 1
-                    
-                    # Send payment reminder for failed payments
-                    pet_doc = await db.pets.find_one({"pet_id": customer_id})
-                    if pet_doc:
-                        pet = Pet(**pet_doc)
-                        await send_payment_reminder(pet, background_tasks)
+        record = await db.payment_imports.find_one_and_update(
+            {"_id": file_hash},
+            {
+                "$set": {"status": "completed", "completed_at": datetime.now(timezone.utc)},
+                "$unset": {"reminder_pet_ids": ""}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        updated_count = record["updated_count"]
+        failed_count = record["failed_count"]
         
         return {
             "success": True,
+            "duplicate": False,
+            "import_id": file_hash,
             "updated_count": updated_count,
             "failed_count": failed_count,
+            "duplicate_rows": record["duplicate_rows"],
             "message": f"Updated {updated_count} successful payments, {failed_count} failed payments. Reminders sent to failed payments."
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error importing payment results: {str(e)}")
+        if claimed_hash is not None:
+            # Release the lease so a retry resumes from the checkpoint at once
+            await db.payment_imports.update_one(
+                {"_id": claimed_hash, "status": "in_progress"},
+                {"$set": {"heartbeat_at": datetime(1970, 1, 1, tzinfo=timezone.utc)}}
+            )
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Leave the spooled upload for Starlette to close
+        if text is not None:
+            text.detach()
 
 @api_router.post("/admin/pets/update-payment-status")
 async def update_payment_status(token: str, update: PaymentUpdate):
     """Update payment status for a pet"""
     verify_admin(token)
     try:
-        update_data = {"payment_status": update.status}
+        extra_set = {}
         if update.status == "paid":
-            update_data["last_payment"] = datetime.now(timezone.utc)
+            extra_set["last_payment"] = datetime.now(timezone.utc)
         
-        result = await db.pets.update_one(
-            {"pet_id": update.pet_id},
-            {"$set": update_data}
-        )
+        previous = await transition_pet(update.pet_id, "payment_status", update.status, extra_set)
+        invalidate_scan_views(update.pet_id)
         
-        if result.modified_count == 0:
+        if previous is None:
             raise HTTPException(status_code=404, detail="Pet not found")
         
         return {"success": True, "message": f"Payment status updated to {update.status}"}
@@ -1188,6 +3328,126 @@ async def update_payment_status(token: str, update: PaymentUpdate):
         logging.error(f"Error updating payment status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Index registry
+# Every index the API relies on, applied at startup. (collection, keys, options)
+INDEX_REGISTRY = [
+    ("pets", [("pet_id", ASCENDING)], {"unique": True}),
+    ("pets", [("owner.email", ASCENDING)], {}),
+    ("pets", [("payment_status", ASCENDING), ("tag_status", ASCENDING)], {}),
+    ("pets", [("payment_status", ASCENDING), ("pet_id", ASCENDING)], {}),
+    ("pets", [("tag_status", ASCENDING), ("pet_id", ASCENDING)], {}),
+    ("pets", [("created_at", ASCENDING), ("pet_id", ASCENDING)], {}),
+    ("pets", [("manufacturing_batch", ASCENDING)], {"sparse": True}),
+    ("tag_replacements", [("original_pet_id", ASCENDING)], {}),
+    ("tag_replacements", [("new_pet_id", ASCENDING)], {}),
+    ("manufacturing_batches", [("batch_id", ASCENDING)], {}),
+    ("shipping_batches", [("shipping_id", ASCENDING)], {}),
+    ("fee_adjustments", [("status", ASCENDING)], {}),
+    ("email_outbox", [("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+    ("email_outbox", [("sent_at", ASCENDING)], {"expireAfterSeconds": EMAIL_OUTBOX_RETENTION_SECONDS}),
+    ("payment_import_rows", [("created_at", ASCENDING)], {"expireAfterSeconds": PAYMENT_IMPORT_ROW_RETENTION_SECONDS}),
+]
+
+# Every query shape the API issues, with representative values, checked with
+# explain() so a missing index shows up as a startup failure rather than a
+# slow COLLSCAN in production. Deliberate full scans carry the reason.
+QUERY_SHAPES = [
+    {"collection": "pets", "filter": {"pet_id": "PET000001"}},
+    {"collection": "pets", "filter": {"pet_id": {"$in": ["PET000001", "PET000002"]}}},
+    {"collection": "pets", "filter": {"pet_id": {"$in": ["PET000001"]}, "tag_status": {"$ne": "shipped"}}},
+    {"collection": "pets", "filter": {"pet_id": {"$in": ["PET000001"]}, "tag_status": "ordered"}},
+    {"collection": "pets", "filter": {"pet_id": "PET000001", "payment_status": {"$ne": "arrears"}}},
+    {"collection": "pets", "filter": {"pet_id": "PET000001", "owner.email": "owner@example.com"}},
+    {"collection": "pets", "filter": {"owner.email": "owner@example.com"}},
+    {"collection": "pets", "filter": {"payment_status": "paid"}},
+    {"collection": "pets", "filter": {"payment_status": "paid"}, "sort": {"pet_id": 1}},
+    {"collection": "pets", "filter": {"payment_status": "arrears"}},
+    {"collection": "pets", "filter": {"tag_status": "ordered"}},
+    {"collection": "pets", "filter": {
+        "payment_status": "paid",
+        "$or": [
+            {"annual_adjustment_date": {"$exists": False}},
+            {"annual_adjustment_date": {"$lt": datetime(2000, 1, 1)}}
+        ]
+    }},
+    {"collection": "pets", "filter": {
+        "payment_status": "paid",
+        "$or": [
+            {"annual_adjustment_date": {"$exists": False}},
+            {"annual_adjustment_date": {"$lt": datetime(2000, 1, 1)}}
+        ],
+        "pet_id": {"$gt": "PET000001", "$lte": "PET005001"}
+    }, "sort": {"pet_id": 1}},
+    {"collection": "fee_adjustments", "filter": {"status": "running"}},
+    {"collection": "email_outbox", "filter": {
+        "status": {"$in": ["pending", "sending"]},
+        "next_attempt_at": {"$lte": datetime(2000, 1, 1)}
+    }, "sort": {"next_attempt_at": 1}},
+    {"collection": "email_outbox", "filter": {"status": "failed"}},
+    {"collection": "pets", "filter": {"_id": {"$gte": ObjectId.from_datetime(datetime(2000, 1, 1))}}},
+    {"collection": "tag_replacements", "filter": {"original_pet_id": "PET000001"}},
+    {"collection": "payment_imports", "filter": {"_id": "0" * 64}},
+    {"collection": "payment_import_rows", "filter": {"_id": {"$in": ["0" * 64]}}},
+    {"collection": "pets", "filter": {"photo_url": {"$ne": None}, "photo_variants": None},
+     "allow_collscan": "one-off photo variant backfill"},
+    {"collection": "pets", "filter": {}, "sort": {"pet_id": 1}},
+    {"collection": "pets", "filter": {"pet_id": {"$gt": "PET000001"}}, "sort": {"pet_id": 1}},
+    {"collection": "pets", "filter": {"tag_status": "ordered", "pet_id": {"$gt": "PET000001"}}, "sort": {"pet_id": 1}},
+    {"collection": "pets", "filter": {"payment_status": "arrears", "pet_id": {"$gt": "PET000001"}}, "sort": {"pet_id": 1}},
+    {"collection": "pets", "filter": {}, "sort": {"created_at": 1, "pet_id": 1}},
+    {"collection": "pets", "filter": {}, "allow_collscan": "admin stats aggregation groups every pet"},
+    {"collection": "tag_replacements", "filter": {}, "allow_collscan": "admin stats counts every replacement"},
+]
+
+VERIFY_QUERY_PLANS = os.environ.get('VERIFY_QUERY_PLANS', 'true').lower() in ('1', 'true', 'yes')
+
+async def ensure_indexes():
+    for collection, keys, options in INDEX_REGISTRY:
+        await db[collection].create_index(keys, **options)
+
+def plan_stages(plan: dict) -> List[str]:
+    """Flatten the stage names of an explain() winning plan"""
+    stages = [plan["stage"]] if "stage" in plan else []
+    for child_key in ("inputStage", "queryPlan"):
+        if child_key in plan:
+            stages.extend(plan_stages(plan[child_key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(plan_stages(child))
+    return stages
+
+async def check_query_plans() -> List[dict]:
+    """explain() every registered query shape and report its plan stages"""
+    report = []
+    for shape in QUERY_SHAPES:
+        find = {"find": shape["collection"], "filter": shape["filter"]}
+        if "sort" in shape:
+            find["sort"] = shape["sort"]
+        explained = await db.command({"explain": find, "verbosity": "queryPlanner"})
+        stages = plan_stages(explained["queryPlanner"]["winningPlan"])
+        report.append({
+            "collection": shape["collection"],
+            "filter": json.dumps(shape["filter"], default=str),
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "allowed_reason": shape.get("allow_collscan")
+        })
+    return report
+
+def unexpected_collscans(report: List[dict]) -> List[dict]:
+    return [entry for entry in report if entry["collscan"] and not entry["allowed_reason"]]
+
+@api_router.get("/admin/indexes/check")
+async def get_query_plan_report(token: str):
+    """Explain every registered query shape and flag collection scans"""
+    verify_admin(token)
+    try:
+        report = await check_query_plans()
+        failures = unexpected_collscans(report)
+        return {"success": not failures, "collscans": failures, "shapes": report}
+    except Exception as e:
+        logging.error(f"Error checking query plans: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -1206,6 +3466,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+background_jobs = []
+
+@app.on_event("startup")
+async def apply_index_registry():
+    await ensure_indexes()
+    if VERIFY_QUERY_PLANS:
+        failures = unexpected_collscans(await check_query_plans())
+        if failures:
+            shapes = "; ".join(f"{f['collection']} {f['filter']}" for f in failures)
+            raise RuntimeError(f"Query shapes fall back to COLLSCAN: {shapes}")
+
+@app.on_event("startup")
+async def start_render_pool():
+    global render_pool
+    if RENDER_POOL_WORKERS > 0:
+        render_pool = ProcessPoolExecutor(
+            max_workers=RENDER_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+@app.on_event("startup")
+async def start_stats_reconciliation():
+    if STATS_RECONCILE_INTERVAL_SECONDS > 0:
+        background_jobs.append(asyncio.create_task(reconcile_stats_periodically()))
+
+@app.on_event("startup")
+async def start_pet_id_filter():
+    try:
+        await pet_id_filter.rebuild()
+    except Exception as e:
+        logging.error(f"Error building pet ID filter: {str(e)}")
+    background_jobs.append(asyncio.create_task(refresh_pet_id_filter_periodically()))
+
+@app.on_event("startup")
+async def resume_fee_adjustments():
+    async for job in db.fee_adjustments.find({"status": "running"}, {"_id": 1}):
+        logging.info(f"Resuming fee adjustment {job['_id']}")
+        start_fee_adjustment_job(job["_id"])
+
+@app.on_event("startup")
+async def start_email_outbox():
+    await run_in_threadpool(precompile_email_templates)
+    background_jobs.append(asyncio.create_task(drain_email_outbox()))
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    jobs = list(background_jobs)
+    for job in jobs:
+        job.cancel()
+    # Let cancelled jobs release their leases before the client closes
+    await asyncio.gather(*jobs, return_exceptions=True)
+    await smtp_pool.close()
+    if render_pool is not None:
+        render_pool.shutdown(wait=False, cancel_futures=True)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
@@ -0,0 +1,359 @@
+import asyncio
+import os
+import sys
+import time
+import json
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# The benchmarks import the backend module directly so they can time its
+# internal read paths against the same MongoDB the API uses.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+def summarize(name, samples):
+    """Print latency percentiles for a list of durations in seconds"""
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1000
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000
+    mean = statistics.mean(samples) * 1000
+    print(f"{name:<28} n={len(samples):<6} mean={mean:8.3f}ms p50={p50:8.3f}ms p99={p99:8.3f}ms")
+
+async def bench_scan_read(iterations):
+    """Compare the legacy full-document scan read with the projection read"""
+    import bson
+    import server
+
+    pet_ids = await server.db.pets.distinct("pet_id")
+    if not pet_ids:
+        print("❌ No pets found - register some pets first")
+        return 1
+
+    async def legacy(pet_id):
+        pet_doc = await server.db.pets.find_one({"pet_id": pet_id})
+        pet = server.Pet(**pet_doc)
+        server.QRScanResponse(
+            pet_name=pet.name,
+            pet_photo_url=pet.photo_url,
+            owner_name=pet.owner.name,
+            owner_mobile=pet.owner.mobile
+        )
+
+    async def projection(pet_id):
+        await server.load_scan_entry(pet_id)
+
+    paths = [
+        ("full document + Pet model", legacy, None),
+        ("projection", projection, server.SCAN_PROJECTION)
+    ]
+    for name, fn, fields in paths:
+        samples = []
+        for i in range(iterations):
+            pet_id = pet_ids[i % len(pet_ids)]
+            start = time.perf_counter()
+            await fn(pet_id)
+            samples.append(time.perf_counter() - start)
+        summarize(name, samples)
+
+        sizes = []
+        async for pet_doc in server.db.pets.find({}, fields).limit(200):
+            sizes.append(len(bson.encode(pet_doc)))
+        print(f"{'':<28} avg document size={statistics.mean(sizes):.0f} bytes")
+    return 0
+
+def register_test_pet(api_url, index):
+    import requests
+
+    pet_data = {
+        "pet_name": f"Bench {index}",
+        "breed": "Mixed",
+        "owner_name": "Benchmark Owner",
+        "mobile": "+27123456789",
+        "email": "benchmark@example.com",
+        "address": "1 Benchmark Rd, Cape Town",
+        "bank_account_number": "123456789",
+        "branch_code": "632005",
+        "account_holder_name": "Benchmark Owner"
+    }
+    files = {"photo": ("bench.jpg", b"benchmark image content", "image/jpeg")}
+    response = requests.post(f"{api_url}/pets/register", data={"pet_data": json.dumps(pet_data)}, files=files)
+    return response.status_code, response.json() if response.ok else {}
+
+def bench_scan_burst(base_url, registrations, concurrency):
+    """Measure scan latency while a burst of registrations is in progress"""
+    import requests
+
+    api_url = f"{base_url}/api"
+    status, body = register_test_pet(api_url, 0)
+    if status != 200:
+        print(f"❌ Could not register the scan target pet (status {status})")
+        return 1
+    pet_id = body["pet_id"]
+
+    def scan_until(stop, samples):
+        session = requests.Session()
+        while not stop.is_set():
+            start = time.perf_counter()
+            session.get(f"{api_url}/scan/{pet_id}", headers={"Cache-Control": "no-cache"})
+            samples.append(time.perf_counter() - start)
+
+    baseline = []
+    stop = threading.Event()
+    scanner = threading.Thread(target=scan_until, args=(stop, baseline))
+    scanner.start()
+    time.sleep(3)
+    stop.set()
+    scanner.join()
+    summarize("scan (idle)", baseline)
+
+    during = []
+    stop = threading.Event()
+    scanner = threading.Thread(target=scan_until, args=(stop, during))
+    scanner.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: register_test_pet(api_url, i)[0], range(1, registrations + 1)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    scanner.join()
+    summarize("scan (registration burst)", during)
+    print(f"{'':<28} {results.count(200)}/{registrations} registrations in {elapsed:.1f}s")
+    return 0
+
+def bench_admin_fields(base_url, iterations, limit):
+    """Compare response size and latency of admin pet pages per field set"""
+    import requests
+
+    session = requests.Session()
+    for fields in [None, "summary", "print", "pet_id,tag_status"]:
+        params = {"token": os.environ.get("ADMIN_TOKEN", "admin123"), "limit": limit}
+        if fields:
+            params["fields"] = fields
+        samples = []
+        sizes = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = session.get(f"{base_url}/api/admin/pets", params=params)
+            samples.append(time.perf_counter() - start)
+            sizes.append(len(response.content))
+        summarize(f"fields={fields or 'full Pet'}", samples)
+        print(f"{'':<28} avg response size={statistics.mean(sizes):.0f} bytes")
+    return 0
+
+SAMPLE_EMAIL_CONTEXTS = {
+    "qr_code_email.html": {
+        "owner_name": "Benchmark Owner",
+        "owner_email": "benchmark@example.com",
+        "pet_name": "Bench",
+        "breed": "Mixed",
+        "pet_id": "PET000001",
+        "registration_date": "2024-01-01",
+        "customer_portal_url": "http://localhost:3000/customer"
+    },
+    "payment_reminder.html": {
+        "owner_name": "Benchmark Owner",
+        "pet_name": "Bench",
+        "pet_id": "PET000001",
+        "monthly_fee": "2.00",
+        "amount_due": "2.00",
+        "last_payment_date": "2024-01-01"
+    },
+    "payment_reminder_digest.html": {
+        "owner_name": "Benchmark Owner",
+        "pets": [
+            {"pet_name": f"Bench {n}", "pet_id": f"PET00000{n}", "monthly_fee": "2.00", "last_payment_date": "2024-01-01"}
+            for n in range(1, 4)
+        ],
+        "amount_due": "6.00"
+    },
+    "shipping_notification_digest.html": {
+        "owner_name": "Benchmark Owner",
+        "pets": [{"pet_name": f"Bench {n}", "pet_id": f"PET00000{n}"} for n in range(1, 4)],
+        "courier": "PostNet",
+        "tracking_number": "TRK000001",
+        "shipping_date": "2024-01-01",
+        "estimated_delivery": "2024-01-04"
+    },
+    "shipping_notification.html": {
+        "owner_name": "Benchmark Owner",
+        "pet_name": "Bench",
+        "pet_id": "PET000001",
+        "courier": "PostNet",
+        "tracking_number": "TRK000001",
+        "shipping_date": "2024-01-01",
+        "estimated_delivery": "2024-01-04"
+    }
+}
+
+def bench_templates(iterations, batch_size):
+    """Per-message render cost of each notification template"""
+    from jinja2 import Environment, FileSystemLoader
+    import server
+
+    loader = FileSystemLoader(str(server.templates_dir))
+    for template_name in server.EMAIL_TEMPLATES:
+        print(template_name)
+        context = SAMPLE_EMAIL_CONTEXTS[template_name]
+
+        compiles = []
+        for _ in range(20):
+            start = time.perf_counter()
+            Environment(loader=loader).get_template(template_name)
+            compiles.append(time.perf_counter() - start)
+        summarize("  compile from source", compiles)
+
+        cached_loads = []
+        for _ in range(20):
+            start = time.perf_counter()
+            Environment(loader=loader, bytecode_cache=server.env.bytecode_cache).get_template(template_name)
+            cached_loads.append(time.perf_counter() - start)
+        summarize("  load from bytecode cache", cached_loads)
+
+        # One get_template + render per message, as send_email did
+        singles = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            server.env.get_template(template_name).render(**{**context, "pet_id": f"PET{i:06d}"})
+            singles.append(time.perf_counter() - start)
+        summarize("  render per message", singles)
+
+        batched = []
+        for offset in range(0, iterations, batch_size):
+            contexts = [{**context, "pet_id": f"PET{i:06d}"} for i in range(offset, min(iterations, offset + batch_size))]
+            start = time.perf_counter()
+            server.render_email_batch(template_name, contexts)
+            batched.append((time.perf_counter() - start) / len(contexts))
+        summarize(f"  batch of {batch_size} (per msg)", batched)
+    return 0
+
+class SMTPStandIn:
+    """Local SMTP sink that accepts and discards every message.
+
+    session_delay stands in for the TLS handshake and login a real relay
+    costs at the start of every session.
+    """
+
+    def __init__(self, session_delay):
+        self.session_delay = session_delay
+        self.sessions = 0
+        self.messages = 0
+
+    async def handle(self, reader, writer):
+        self.sessions += 1
+        await asyncio.sleep(self.session_delay)
+        writer.write(b"220 localhost ESMTP stand-in\r\n")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                writer.write(b"250-localhost\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n")
+            elif command == b"DATA":
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                while (await reader.readline()) not in (b".\r\n", b""):
+                    pass
+                self.messages += 1
+                writer.write(b"250 OK\r\n")
+            elif command == b"QUIT":
+                writer.write(b"221 Bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        writer.close()
+
+async def bench_email_throughput(messages, pool_size, session_delay_ms):
+    """Compare a fresh SMTP session per message with the outbox's session pool"""
+    import aiosmtplib
+    from email.message import EmailMessage
+    import server
+
+    stand_in = SMTPStandIn(session_delay_ms / 1000)
+    smtp_server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+    port = smtp_server.sockets[0].getsockname()[1]
+
+    def build_message(i):
+        message = EmailMessage()
+        message["From"] = "billing@example.com"
+        message["To"] = f"owner{i}@example.com"
+        message["Subject"] = f"💳 Payment Reminder for Bench {i}"
+        message.set_content(f"<p>Reminder {i}</p>" * 50, subtype="html")
+        return message
+
+    async def per_message(message):
+        await aiosmtplib.send(message, hostname="127.0.0.1", port=port, start_tls=False)
+
+    pool = server.SMTPPool("127.0.0.1", port, size=pool_size, messages_per_session=server.EMAIL_MESSAGES_PER_SESSION)
+
+    paths = [
+        ("session per message", per_message),
+        (f"pooled ({pool_size} sessions)", pool.send)
+    ]
+    async with smtp_server:
+        for name, send in paths:
+            stand_in.sessions = 0
+            stand_in.messages = 0
+            # Same concurrency for both paths, so only session reuse differs
+            limit = asyncio.Semaphore(pool_size)
+            samples = []
+
+            async def timed(i):
+                async with limit:
+                    start = time.perf_counter()
+                    await send(build_message(i))
+                    samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(timed(i) for i in range(messages)))
+            elapsed = time.perf_counter() - start
+            summarize(name, samples)
+            print(f"{'':<28} {stand_in.messages / elapsed:.0f} msg/s over {stand_in.sessions} SMTP sessions")
+        await pool.close()
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Pet Tag System backend benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    scan_read = subparsers.add_parser("scan-read", help="Full-document vs projection scan reads")
+    scan_read.add_argument("--iterations", type=int, default=2000)
+
+    scan_burst = subparsers.add_parser("scan-burst", help="Scan latency during a registration burst (HTTP)")
+    scan_burst.add_argument("--base-url", default=os.environ.get("BACKEND_URL", "http://localhost:8001"))
+    scan_burst.add_argument("--registrations", type=int, default=200)
+    scan_burst.add_argument("--concurrency", type=int, default=16)
+
+    admin_fields = subparsers.add_parser("admin-fields", help="Admin pet page size/latency per field set (HTTP)")
+    admin_fields.add_argument("--base-url", default=os.environ.get("BACKEND_URL", "http://localhost:8001"))
+    admin_fields.add_argument("--iterations", type=int, default=50)
+    admin_fields.add_argument("--limit", type=int, default=500)
+
+    email_throughput = subparsers.add_parser("email-throughput", help="Per-message SMTP sessions vs the outbox pool (local SMTP stand-in)")
+    email_throughput.add_argument("--messages", type=int, default=500)
+    email_throughput.add_argument("--pool-size", type=int, default=2)
+    email_throughput.add_argument("--session-delay-ms", type=float, default=50.0)
+
+    templates = subparsers.add_parser("templates", help="Per-message render cost of the notification templates")
+    templates.add_argument("--iterations", type=int, default=2000)
+    templates.add_argument("--batch-size", type=int, default=50)
+
+    args = parser.parse_args()
+
+    if args.benchmark == "scan-read":
+        return asyncio.run(bench_scan_read(args.iterations))
+    if args.benchmark == "scan-burst":
+        return bench_scan_burst(args.base_url, args.registrations, args.concurrency)
+    if args.benchmark == "admin-fields":
+        return bench_admin_fields(args.base_url, args.iterations, args.limit)
+    if args.benchmark == "templates":
+        return bench_templates(args.iterations, args.batch_size)
+    if args.benchmark == "email-throughput":
+        return asyncio.run(bench_email_throughput(args.messages, args.pool_size, args.session_delay_ms))
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -146,6 +146,28 @@ class PetTagAPITester:
             return True
         return False
         
+    def test_qr_scan_not_modified(self):
+        """Test conditional QR scan returns 304 for a matching ETag"""
+        if not self.pet_id:
+            print("❌ Cannot test conditional QR scan without a pet ID")
+            return False
+        
+        first = requests.get(f"{self.api_url}/scan/{self.pet_id}")
+        etag = first.headers.get('ETag')
+        print(f"ETag: {etag}, Cache-Control: {first.headers.get('Cache-Control')}")
+        if not etag:
+            print("❌ Failed - No ETag on scan response")
+            return False
+        
+        success, _ = self.run_test(
+            "QR Code Scan (If-None-Match)",
+            "GET",
+            f"scan/{self.pet_id}",
+            304,
+            headers={"If-None-Match": etag}
+        )
+        return success
+        
     # Admin functionality tests
     
     def test_admin_login(self):
@@ -182,6 +204,91 @@ class PetTagAPITester:
             return True
         return False
         
+    def test_cache_stats(self):
+        """Test that a repeat scan is served from the scan cache"""
+        def scan_stats():
+            success, response = self.run_test(
+                "Cache Stats",
+                "GET",
+                "admin/cache/stats",
+                200,
+                params={"token": self.admin_token}
+            )
+            return response.get('scan') if success else None
+        
+        if self.pet_id:
+            # Make sure the pet is cached before measuring
+            self.run_test("QR Code Scan (warm cache)", "GET", f"scan/{self.pet_id}", 200)
+        
+        before = scan_stats()
+        if before is None:
+            return False
+        if not self.pet_id:
+            return True
+        
+        self.run_test("QR Code Scan (cached)", "GET", f"scan/{self.pet_id}", 200)
+        after = scan_stats()
+        if after is None:
+            return False
+        
+        print(f"Scan cache: size={after.get('size')} hits={before.get('hits')}->{after.get('hits')} misses={after.get('misses')} evictions={after.get('evictions')}")
+        if after.get('hits', 0) <= before.get('hits', 0):
+            print("❌ Repeat scan was not a cache hit")
+            return False
+        return True
+        
+    def test_email_metrics(self):
+        """Test email outbox and dispatch metrics"""
+        success, response = self.run_test(
+            "Email Metrics",
+            "GET",
+            "admin/email/metrics",
+            200,
+            params={"token": self.admin_token}
+        )
+        
+        if success and 'outbox' in response and 'daily_quota' in response:
+            dispatch = response.get('dispatch', {})
+            print(f"Outbox: {response['outbox']}")
+            print(f"Dispatch: queued={dispatch.get('queued')} sent={dispatch.get('sent')} failed={dispatch.get('failed')} retried={dispatch.get('retried')}")
+            return True
+        return False
+        
+    def test_reconcile_stats(self):
+        """Test that the stats counters match a full recount"""
+        success, response = self.run_test(
+            "Reconcile Admin Stats",
+            "POST",
+            "admin/stats/reconcile",
+            200,
+            params={"token": self.admin_token, "repair": "false"}
+        )
+        
+        if success and 'drift' in response:
+            if response['drift']:
+                print(f"❌ Failed - Stats counters drifted: {response['drift']}")
+                return False
+            print("Stats counters match a full recount")
+            return True
+        return False
+        
+    def test_index_check(self):
+        """Test that every registered query shape is served by an index"""
+        success, response = self.run_test(
+            "Index Check",
+            "GET",
+            "admin/indexes/check",
+            200,
+            params={"token": self.admin_token}
+        )
+        
+        if success and response.get('success') is True and response.get('collscans') == []:
+            print(f"Checked {len(response.get('shapes', []))} query shapes, no unexpected collection scans")
+            return True
+        if success:
+            print(f"❌ Failed - Unexpected collection scans: {response.get('collscans')}")
+        return False
+        
     def test_get_all_pets(self):
         """Test getting all pets for admin"""
         success, response = self.run_test(
@@ -192,11 +299,74 @@ class PetTagAPITester:
             params={"token": self.admin_token}
         )
         
-        if success and isinstance(response, list):
-            print(f"Retrieved {len(response)} pets")
+        if success and isinstance(response.get('items'), list):
+            print(f"Retrieved {len(response['items'])} pets (total estimate: {response.get('total_estimate')})")
+            
+            if response.get('next_cursor'):
+                next_success, next_page = self.run_test(
+                    "Get All Pets (next page)",
+                    "GET",
+                    "admin/pets",
+                    200,
+                    params={"token": self.admin_token, "cursor": response['next_cursor']}
+                )
+                first_ids = {p['pet_id'] for p in response['items']}
+                if not next_success or first_ids & {p['pet_id'] for p in next_page.get('items', [])}:
+                    print("❌ Failed - Next page overlaps the first page")
+                    return False
             return True
         return False
         
+    def test_get_pets_summary(self):
+        """Test the fields=summary projection of the admin pet list"""
+        success, response = self.run_test(
+            "Get All Pets (summary fields)",
+            "GET",
+            "admin/pets",
+            200,
+            params={"token": self.admin_token, "fields": "summary"}
+        )
+        
+        if not success or not isinstance(response.get('items'), list):
+            return False
+        if any('bank_account_number' in (pet.get('owner') or {}) for pet in response['items']):
+            print("❌ Failed - Summary items include bank details")
+            return False
+        print(f"Retrieved {len(response['items'])} summary rows")
+        
+        success, _ = self.run_test(
+            "Get All Pets (unknown field)",
+            "GET",
+            "admin/pets",
+            400,
+            params={"token": self.admin_token, "fields": "pet_id,not_a_field"}
+        )
+        return success
+        
+    def test_export_pets(self):
+        """Test streaming NDJSON and CSV export of the pet registry"""
+        all_passed = True
+        for export_format in ['ndjson', 'csv']:
+            self.tests_run += 1
+            print(f"\n🔍 Testing Export Pets ({export_format})...")
+            response = requests.get(
+                f"{self.api_url}/admin/pets/export",
+                params={"token": self.admin_token, "format": export_format},
+                stream=True
+            )
+            lines = [line for line in response.iter_lines() if line]
+            if response.status_code == 200 and lines:
+                if export_format == 'ndjson' and 'bank_account_number' in json.loads(lines[0]).get('owner', {}):
+                    print("❌ Failed - Bank details exported without include_bank_details")
+                    all_passed = False
+                    continue
+                self.tests_passed += 1
+                print(f"✅ Passed - {len(lines)} {export_format} lines")
+            else:
+                print(f"❌ Failed - Status {response.status_code}, {len(lines)} lines")
+                all_passed = False
+        return all_passed
+        
     def test_generate_billing_csv(self):
         """Test generating billing CSV"""
         success, response = self.run_test(
@@ -212,7 +382,14 @@ class PetTagAPITester:
             print(f"Generated billing CSV: {self.csv_filename}")
             print(f"Total Amount: R{response.get('total_amount')}")
             print(f"Customer Count: {response.get('customer_count')}")
+            print(f"Row Count: {response.get('row_count')} SHA-256: {response.get('sha256')}")
             print(f"Download URL: {response.get('download_url')}")
+            if 'row_count' not in response or not response.get('sha256'):
+                print("❌ Failed - Response is missing row_count or sha256")
+                return False
+            if response['row_count'] != response.get('customer_count'):
+                print("❌ Failed - row_count does not match customer_count")
+                return False
             return True
         return False
         
@@ -324,8 +501,8 @@ class PetTagAPITester:
             params={"token": self.admin_token}
         )
         
-        if success and isinstance(response, list):
-            print(f"Print queue contains {len(response)} pets")
+        if success and isinstance(response.get('items'), list):
+            print(f"Print queue page contains {len(response['items'])} pets (total estimate: {response.get('total_estimate')})")
             return True
         return False
         
@@ -499,6 +676,70 @@ class PetTagAPITester:
             return True
         return False
 
+    def test_reimport_payment_results(self):
+        """Test that uploading the same results file twice applies it once"""
+        csv_buffer = io.StringIO()
+        writer = csv.writer(csv_buffer)
+        writer.writerow(['Customer_ID', 'Status', 'Amount', 'Date'])
+        writer.writerow([self.pet_id, 'success', '2.00', datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')])
+        content = csv_buffer.getvalue().encode('utf-8')
+        
+        responses = []
+        for attempt in ("First", "Repeat"):
+            success, response = self.run_test(
+                f"{attempt} Payment Results Import",
+                "POST",
+                "admin/payments/import-results",
+                200,
+                files={'results_file': ('reimport_results.csv', content, 'text/csv')},
+                params={"token": self.admin_token}
+            )
+            if not success:
+                return False
+            responses.append(response)
+        
+        first, repeat = responses
+        if first.get('duplicate') or not repeat.get('duplicate'):
+            print(f"❌ Expected only the repeat upload to be flagged duplicate: {first}, {repeat}")
+            return False
+        if repeat.get('import_id') != first.get('import_id'):
+            print("❌ Repeat upload was fingerprinted differently")
+            return False
+        print(f"Repeat upload skipped: {repeat.get('message')}")
+        return True
+
+    def test_bulk_register_pets(self):
+        """Test bulk pet registration from CSV"""
+        columns = ['pet_name', 'breed', 'owner_name', 'mobile', 'email', 'address',
+                   'bank_account_number', 'branch_code', 'account_holder_name']
+        csv_buffer = io.StringIO()
+        writer = csv.writer(csv_buffer)
+        writer.writerow(columns)
+        writer.writerow(['Rex', 'Beagle', 'Shelter One', '+27111111111', 'shelter@example.com',
+                         '1 Shelter Rd, Durban', '111111111', '632005', 'Shelter One'])
+        writer.writerow(['Milo', 'Terrier', 'Shelter One', '+27111111111', 'shelter@example.com',
+                         '1 Shelter Rd, Durban', '111111111', '632005', 'Shelter One'])
+        writer.writerow(['Missing Fields'])
+        
+        files = {
+            'pets_file': ('shelter_pets.csv', csv_buffer.getvalue().encode('utf-8'), 'text/csv')
+        }
+        
+        success, response = self.run_test(
+            "Bulk Register Pets",
+            "POST",
+            "admin/pets/bulk-register",
+            200,
+            files=files,
+            params={"token": self.admin_token}
+        )
+        
+        if success and response.get('registered') == 2 and response.get('failed') == 1:
+            print(f"Bulk registered: {[r.get('pet_id') for r in response.get('results', []) if r.get('success')]}")
+            return True
+        print(f"Unexpected bulk registration result: {response}")
+        return False
+
     def test_customer_login(self):
         """Test customer login with email and pet ID"""
         if not self.pet_id:
@@ -658,7 +899,23 @@ class PetTagAPITester:
         )
         
         if success and response.get('success'):
-            print(f"Successfully sent {response.get('reminders_sent')} payment reminders")
+            print(f"Successfully sent {response.get('reminders_sent')} payment reminders covering {response.get('pets_reminded')} pets")
+            return True
+        return False
+        
+    def test_annual_fee_adjustment_dry_run(self):
+        """Test previewing the annual fee adjustment without applying it"""
+        success, response = self.run_test(
+            "Annual Fee Adjustment (dry run)",
+            "POST",
+            "admin/automation/annual-fee-adjustment",
+            200,
+            params={"token": self.admin_token, "percentage": 5, "dry_run": "true"}
+        )
+        
+        if success and response.get('success') and response.get('dry_run'):
+            print(f"Would affect {response.get('affected_pets')} pets, "
+                  f"revenue delta R{response.get('monthly_revenue_delta')}/month")
             return True
         return False
         
@@ -672,12 +929,31 @@ class PetTagAPITester:
             params={"token": self.admin_token, "percentage": 5}
         )
         
-        if success and response.get('success'):
-            print(f"Successfully applied 5% fee adjustment")
-            print(f"Adjustment ID: {response.get('adjustment_id')}")
-            print(f"Affected Pets: {response.get('affected_pets')}")
-            return True
-        return False
+        if not (success and response.get('success')):
+            return False
+        
+        adjustment_id = response.get('adjustment_id')
+        for _ in range(30):
+            if response.get('status') != 'running':
+                break
+            time.sleep(1)
+            success, response = self.run_test(
+                "Annual Fee Adjustment Progress",
+                "GET",
+                f"admin/automation/annual-fee-adjustment/{adjustment_id}",
+                200,
+                params={"token": self.admin_token}
+            )
+            if not success:
+                return False
+        
+        if response.get('status') != 'completed':
+            print(f"❌ Fee adjustment did not complete: {response}")
+            return False
+        print(f"Successfully applied 5% fee adjustment")
+        print(f"Adjustment ID: {adjustment_id}")
+        print(f"Affected Pets: {response.get('affected_pets')}")
+        return True
 
 def main():
     # Get the backend URL from environment variable or use default
@@ -704,6 +980,10 @@ def main():
     if not tester.test_qr_scan():
         print("❌ QR code scanning test failed")
     
+    # Test conditional QR code scanning
+    if not tester.test_qr_scan_not_modified():
+        print("❌ Conditional QR code scanning test failed")
+    
     print("\n=== Testing Customer Portal & Self-Service ===\n")
     
     # Test customer login
@@ -741,10 +1021,44 @@ def main():
     if not tester.test_admin_stats():
         print("❌ Admin stats test failed")
     
+    # Test every query shape is index-backed
+    if not tester.test_index_check():
+        print("❌ Index check test failed")
+    
+    # Test the summary projection of the pet list
+    if not tester.test_get_pets_summary():
+        print("❌ Get pets summary test failed")
+    
+    # Test streaming export
+    if not tester.test_export_pets():
+        print("❌ Export pets test failed")
+    
+    # Test billing CSV generation and download
+    if not tester.test_generate_billing_csv():
+        print("❌ Generate billing CSV test failed")
+    elif not tester.test_download_billing_csv():
+        print("❌ Download billing CSV test failed")
+    
+    # Test scan cache stats
+    if not tester.test_cache_stats():
+        print("❌ Cache stats test failed")
+    
     # Test sending payment reminders
     if not tester.test_send_payment_reminders():
         print("❌ Send payment reminders test failed")
     
+    # Test payment results re-import is skipped
+    if not tester.test_reimport_payment_results():
+        print("❌ Re-import payment results test failed")
+    
+    # Test email dispatch metrics after the reminders were queued
+    if not tester.test_email_metrics():
+        print("❌ Email metrics test failed")
+    
+    # Test annual fee adjustment preview
+    if not tester.test_annual_fee_adjustment_dry_run():
+        print("❌ Annual fee adjustment dry run test failed")
+    
     # Test annual fee adjustment
     if not tester.test_annual_fee_adjustment():
         print("❌ Annual fee adjustment test failed")
@@ -771,6 +1085,14 @@ def main():
     if not tester.test_create_tag_replacement():
         print("❌ Create tag replacement test failed")
     
+    # Test bulk registration
+    if not tester.test_bulk_register_pets():
+        print("❌ Bulk register pets test failed")
+    
+    # Test the counters kept up with every write above
+    if not tester.test_reconcile_stats():
+        print("❌ Reconcile stats test failed")
+    
     # Print results
     print(f"\n📊 Tests passed: {tester.tests_passed}/{tester.tests_run}")
     return 0 if tester.tests_passed == tester.tests_run else 1
@@ -719,10 +719,19 @@ const AdminLogin = ({ onLogin }) => {
   );
 };
 
+// Admin pet table page size and the columns the tag queues render
+const PET_PAGE_SIZE = 50;
+const TAG_QUEUE_PAGE_SIZE = 100;
+const TAG_QUEUE_STATUSES = ['ordered', 'printed', 'manufactured', 'shipped'];
+const TAG_QUEUE_FIELDS = 'pet_id,name,owner.name,tag_status,shipping_tracking,replacement_count';
+
 // Enhanced Admin Dashboard with automation features
 const AdminDashboard = ({ token }) => {
   const [stats, setStats] = useState(null);
   const [pets, setPets] = useState([]);
+  const [pageCursors, setPageCursors] = useState([null]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [tagPets, setTagPets] = useState([]);
   const [activeTab, setActiveTab] = useState('overview');
   const [activeTagTab, setActiveTagTab] = useState('print-queue');
   const [selectedPets, setSelectedPets] = useState([]);
@@ -742,10 +751,20 @@ const AdminDashboard = ({ token }) => {
     }
   };
 
-  const fetchPets = async () => {
+  const fetchPets = async (cursor = pageCursors[pageCursors.length - 1]) => {
     try {
-      const response = await axios.get(`${API}/admin/pets?token=${token}`);
-      setPets(response.data);
+      // Load only the visible table page, plus the first page of each tag queue
+      const [page, ...queues] = await Promise.all([
+        axios.get(`${API}/admin/pets`, {
+          params: { token, limit: PET_PAGE_SIZE, fields: 'summary', cursor: cursor || undefined }
+        }),
+        ...TAG_QUEUE_STATUSES.map(status => axios.get(`${API}/admin/pets`, {
+          params: { token, tag_status: status, limit: TAG_QUEUE_PAGE_SIZE, fields: TAG_QUEUE_FIELDS }
+        }))
+      ]);
+      setPets(page.data.items);
+      setNextCursor(page.data.next_cursor);
+      setTagPets(queues.flatMap(response => response.data.items));
       setLoading(false);
     } catch (error) {
       console.error('Error fetching pets:', error);
@@ -753,6 +772,17 @@ const AdminDashboard = ({ token }) => {
     }
   };
 
+  const goToNextPage = () => {
+    setPageCursors([...pageCursors, nextCursor]);
+    fetchPets(nextCursor);
+  };
+
+  const goToPreviousPage = () => {
+    const cursors = pageCursors.slice(0, -1);
+    setPageCursors(cursors);
+    fetchPets(cursors[cursors.length - 1]);
+  };
+
   const sendPaymentReminders = async () => {
     try {
       const response = await axios.post(`${API}/admin/automation/send-payment-reminders?token=${token}`);
@@ -767,7 +797,15 @@ const AdminDashboard = ({ token }) => {
     if (!percentage || isNaN(percentage)) return;
     
     try {
-      const response = await axios.post(`${API}/admin/automation/annual-fee-adjustment?token=${token}&percentage=${percentage}`);
+      let response = await axios.post(`${API}/admin/automation/annual-fee-adjustment?token=${token}&percentage=${percentage}`);
+      while (response.data.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        response = await axios.get(`${API}/admin/automation/annual-fee-adjustment/${response.data.adjustment_id}?token=${token}`);
+      }
+      if (response.data.status === 'failed') {
+        alert(`Fee adjustment stopped after ${response.data.affected_pets} pets: ${response.data.error}. Run it again to resume.`);
+        return;
+      }
       alert(`Success! Applied ${percentage}% increase to ${response.data.affected_pets} pets.`);
       fetchStats();
       fetchPets();
@@ -1389,7 +1427,7 @@ const AdminDashboard = ({ token }) => {
                       <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
                         <div>
                           <div className="font-medium">{pet.owner.name}</div>
-                          <div className="text-gray-500">{pet.owner.mobile}</div>
+                          <div className="text-gray-500">{pet.owner.email}</div>
                         </div>
                       </td>
                       <td className="px-6 py-4 whitespace-nowrap">
@@ -1437,6 +1475,24 @@ const AdminDashboard = ({ token }) => {
                 </tbody>
               </table>
             </div>
+            
+            <div className="px-6 py-4 border-t flex justify-between items-center">
+              <button
+                onClick={goToPreviousPage}
+                disabled={pageCursors.length === 1}
+                className="bg-gray-200 text-gray-700 px-4 py-2 rounded-lg hover:bg-gray-300 disabled:opacity-50"
+              >
+                Previous
+              </button>
+              <span className="text-sm text-gray-600">Page {pageCursors.length}</span>
+              <button
+                onClick={goToNextPage}
+                disabled={!nextCursor}
+                className="bg-gray-200 text-gray-700 px-4 py-2 rounded-lg hover:bg-gray-300 disabled:opacity-50"
+              >
+                Next
+              </button>
+            </div>
           </div>
         )}
 
@@ -1447,23 +1503,23 @@ const AdminDashboard = ({ token }) => {
               
               <div className="grid grid-cols-2 md:grid-cols-5 gap-4 mb-6">
                 <div className="bg-orange-50 p-4 rounded-lg text-center">
-                  <div className="text-2xl font-bold text-orange-600">{pets.filter(p => p.tag_status === 'ordered').length}</div>
+                  <div className="text-2xl font-bold text-orange-600">{stats ? stats.tags_ordered : 0}</div>
                   <div className="text-sm text-orange-700">Ordered</div>
                 </div>
                 <div className="bg-blue-50 p-4 rounded-lg text-center">
-                  <div className="text-2xl font-bold text-blue-600">{pets.filter(p => p.tag_status === 'printed').length}</div>
+                  <div className="text-2xl font-bold text-blue-600">{stats ? stats.tags_printed : 0}</div>
                   <div className="text-sm text-blue-700">Printed</div>
                 </div>
                 <div className="bg-purple-50 p-4 rounded-lg text-center">
-                  <div className="text-2xl font-bold text-purple-600">{pets.filter(p => p.tag_status === 'manufactured').length}</div>
+                  <div className="text-2xl font-bold text-purple-600">{stats ? stats.tags_manufactured : 0}</div>
                   <div className="text-sm text-purple-700">Manufactured</div>
                 </div>
                 <div className="bg-indigo-50 p-4 rounded-lg text-center">
-                  <div className="text-2xl font-bold text-indigo-600">{pets.filter(p => p.tag_status === 'shipped').length}</div>
+                  <div className="text-2xl font-bold text-indigo-600">{stats ? stats.tags_shipped : 0}</div>
                   <div className="text-sm text-indigo-700">Shipped</div>
                 </div>
                 <div className="bg-green-50 p-4 rounded-lg text-center">
-                  <div className="text-2xl font-bold text-green-600">{pets.filter(p => p.tag_status === 'delivered').length}</div>
+                  <div className="text-2xl font-bold text-green-600">{stats ? stats.tags_delivered : 0}</div>
                   <div className="text-sm text-green-700">Delivered</div>
                 </div>
               </div>
@@ -1516,7 +1572,7 @@ const AdminDashboard = ({ token }) => {
 
               <TagManagementContent 
                 activeTab={activeTagTab} 
-                pets={pets} 
+                pets={tagPets} 
                 token={token} 
                 onUpdate={() => { fetchPets(); fetchStats(); }}
               />